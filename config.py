@@ -55,6 +55,9 @@ def validate():
     if 'files' in _config and not isinstance(_config['files'], list):
         raise TypeError("Files should be a list")
 
+    if 'deadlines' in _config and not isinstance(_config['deadlines'], dict):
+        raise TypeError("Deadlines should be a dict mapping names to timestamps")
+
     # Validate methods structure (object with class keys)
     if 'methods' in _config:
         if not isinstance(_config['methods'], dict):
@@ -76,6 +76,15 @@ class Build:
         for fh in self._missing:
            shutil.copy2(f"{self._cfgfhs_path}/{fh}", f"{self._repo_path}/{fh}")
 
+    # Opt-in (`options.ccache`): compiles through `ccache`, if the host has
+    # it, so rebuilding unchanged sources (e.g. regrading a repo that hasn't
+    # been pushed to) reuses the last build's objects.
+    def _cmake_args(self):
+        if (self._config.get('options', {}).get('ccache') and
+            self._shell.caps.has("ccache")):
+            return "-DCMAKE_CXX_COMPILER_LAUNCHER=ccache "
+        return ""
+
     # Pre: CMakeLists.txt must be in the target repository directory.
     def _find_exec(self):
         cmake = f'{self._repo_path}/CMakeLists.txt'
@@ -146,7 +155,7 @@ class Build:
 	        f"rm -rf {self._repo_path}/build && " +
 	        f"mkdir -p {self._repo_path}/build && " +
 	        f"cd {self._repo_path}/build && " + 
-	        f"cmake .. && " +
+	        f"cmake {self._cmake_args()}.. && " +
 	        f"make all && " +
             f"./{exec} && " +
 	        f"cd -"
@@ -0,0 +1,199 @@
+from core.shell import Shell
+from core.manifest import Manifest
+
+import os
+import shutil
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+# Moves a fetched corpus (`repos/<milestone>-<prof>`) between grading machines
+# without going back to GitHub(R).
+#
+# `pack()` writes one git bundle per clone plus the manifest to a directory;
+# `unpack()` clones each bundle back into an identical tree on another node,
+# offline, and points its `origin` back at the original remote so later
+# incremental fetches still work. A bundle can only carry complete history, so
+# shallow and partial (blobless, sparse) clones, and "tarball" downloads, are
+# archived as `<name>.tar.gz` instead.
+class Bundler:
+    def __init__(self, root, workers=4):
+        """
+        :param root: The corpus's repo path, e.g. `repos/milestone5-hugh`.
+        :param workers: Repos to pack or unpack concurrently.
+        """
+        self._name = self.__class__.__name__
+        self._shell = Shell()
+        self._root = root
+        self._workers = max(1, int(workers))
+
+    def _git(self, dir, args):
+        stdout, stderr, code = self._shell.cmd(f"git -C {dir} {args}")
+        return stdout.strip(), stderr, code
+
+    def _bundleable(self, dir):
+        """Whether a clone holds complete history, so a bundle can carry it."""
+        if not os.path.isdir(os.path.join(dir, ".git")):
+            return False
+        shallow, stderr, code = self._git(dir,
+                                          "rev-parse --is-shallow-repository")
+        promisor, stderr, _ = self._git(dir,
+                                        "config --get remote.origin.promisor")
+        return code == 0 and shallow != "true" and promisor != "true"
+
+    def _archive(self, dir, file):
+        with tarfile.open(file, "w:gz") as tar:
+            tar.add(dir, arcname=os.path.basename(dir))
+
+    def _pack_repo(self, record, dest):
+        """
+        Bundle or archive a single repo into `dest`.
+
+        :return: A status record with the repo's name, status, exit code, the
+                 file written and the clone's `origin`.
+        """
+        name = record['name']
+        dir = os.path.join(self._root, name)
+        start = time.monotonic()
+        result = {'name': name, 'status': "bundled", 'code': 0,
+                  'file': f"{name}.bundle", 'remote': None}
+
+        if self._bundleable(dir):
+            file = os.path.abspath(os.path.join(dest, result['file']))
+            stdout, stderr, code = self._git(
+                dir, f"bundle create -q {file} --all"
+            )
+            result['code'] = code
+            if code != 0:
+                result['status'] = "failed"
+                print(f"{self._name}:\tgit stderr:\t{name}:\t{stderr}")
+            remote, stderr, code = self._git(dir, "remote get-url origin")
+            result['remote'] = remote if code == 0 else None
+        else:
+            result['status'] = "archived"
+            result['file'] = f"{name}.tar.gz"
+            try:
+                self._archive(dir, os.path.join(dest, result['file']))
+            except OSError as e:
+                result['status'] = "failed"
+                result['code'] = 1
+                print(f"{self._name}:\tarchive failed:\t{name}:\t{e}")
+
+        print(f"{self._name}:\t{result['status']}:\t{name}\t" +
+              f"({time.monotonic() - start:.2f}s)")
+        return result
+
+    def _unpack_repo(self, record, src):
+        """Clone or extract a single repo from `src` into the repo path."""
+        name = record['name']
+        dir = os.path.join(self._root, name)
+        file = os.path.join(src, record['bundle'])
+        start = time.monotonic()
+        result = {'name': name, 'status': "unbundled", 'code': 0}
+
+        # The import replaces whatever was there, so the tree matches.
+        shutil.rmtree(dir, ignore_errors=True)
+        if file.endswith(".bundle"):
+            stdout, stderr, code = self._shell.cmd(
+                f"git clone -q {file} {dir}"
+            )
+            result['code'] = code
+            if code != 0:
+                print(f"{self._name}:\tgit stderr:\t{name}:\t{stderr}")
+            elif record.get('remote'):
+                self._git(dir, f"remote set-url origin {record['remote']}")
+            if code == 0 and record.get('head'):
+                head, stderr, code = self._git(dir, "rev-parse HEAD")
+                if head != record['head']:
+                    print(f"{self._name}:\tHEAD mismatch:\t{name}:\t" +
+                          f"{head} != {record['head']}")
+                    result['code'] = code or 1
+        else:
+            result['status'] = "extracted"
+            try:
+                # `r|gz` reads the archive as a stream.
+                with tarfile.open(file, "r|gz") as tar:
+                    tar.extractall(self._root, filter="data")
+            except (OSError, tarfile.TarError) as e:
+                result['code'] = 1
+                print(f"{self._name}:\textract failed:\t{name}:\t{e}")
+
+        if result['code'] != 0:
+            result['status'] = "failed"
+        print(f"{self._name}:\t{result['status']}:\t{name}\t" +
+              f"({time.monotonic() - start:.2f}s)")
+        return result
+
+    def _run(self, work, records, *args):
+        """Run `work` over every record on the worker pool."""
+        results = []
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            futures = [pool.submit(work, r, *args) for r in records]
+            for future in as_completed(futures):
+                results.append(future.result())
+        results.sort(key=lambda r: r['name'])
+        return results
+
+    def pack(self, dest):
+        """
+        Export every fetched repo in the manifest to `dest`, with the
+        manifest (each record also names its bundle and remote).
+
+        :return: A summary dict with `results` (one status record per repo)
+                 and `failed` (the names of repos that couldn't be packed).
+        """
+        records = Manifest(self._root).load()
+        if not records:
+            raise FileNotFoundError(
+                f"{self._name}: no manifest in {self._root}: fetch first"
+            )
+        os.makedirs(dest, exist_ok=True)
+
+        fetched = [r for r in records.values() if r.get('head')]
+        results = self._run(self._pack_repo, fetched, dest)
+
+        packed = {}
+        for name, record in records.items():
+            packed[name] = dict(record, bundle=None, remote=None)
+        for r in results:
+            if r['status'] != "failed":
+                packed[r['name']].update(bundle=r['file'], remote=r['remote'])
+        Manifest(dest).save(packed)
+
+        failed = [r['name'] for r in results if r['status'] == "failed"]
+        print(f"{self._name}:\tpacked:\t{len(results) - len(failed)}\t" +
+              f"failed:\t{len(failed)}\t->\t{dest}")
+        return {'results': results, 'failed': failed}
+
+    def unpack(self, src):
+        """
+        Import a corpus exported by `pack()` from `src` into the repo path,
+        and write its manifest.
+
+        :return: A summary dict with `results` (one status record per repo)
+                 and `failed` (the names of repos that couldn't be unpacked).
+        """
+        packed = Manifest(src).load()
+        if not packed:
+            raise FileNotFoundError(f"{self._name}: no manifest in {src}")
+        os.makedirs(self._root, exist_ok=True)
+
+        bundled = [r for r in packed.values() if r.get('bundle')]
+        results = self._run(self._unpack_repo, bundled, src)
+        failed = [r['name'] for r in results if r['status'] == "failed"]
+
+        records = {}
+        for name, record in packed.items():
+            record = dict(record, path=f"{self._root}/{name}")
+            bundle = record.pop('bundle', None)
+            record.pop('remote', None)
+            # Not carried over, or didn't unpack: no clone on this node.
+            if name in failed or (record.get('head') and not bundle):
+                record.update(head=None, status="failed")
+            records[name] = record
+        Manifest(self._root).save(records)
+
+        print(f"{self._name}:\tunpacked:\t{len(results) - len(failed)}\t" +
+              f"failed:\t{len(failed)}\t<-\t{src}")
+        return {'results': results, 'failed': failed}
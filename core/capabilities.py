@@ -0,0 +1,152 @@
+from tools import util
+
+import os
+import json
+import shutil
+import socket
+import threading
+import subprocess
+
+
+# Tools probed, by capability, with the executables that provide each in
+# order of preference. "ccache" and "ninja" are optional accelerators.
+TOOLS = {
+    "grep": ["grep"],
+    "git": ["git"],
+    "cmake": ["cmake"],
+    "make": ["make"],
+    "cxx": ["c++", "g++", "clang++"],
+    "ccache": ["ccache"],
+    "ninja": ["ninja"],
+}
+
+# Where Git for Windows keeps its UNIX tools (`grep` among them), which often
+# aren't on `PATH`.
+_WINDOWS_PATHS = [
+    r"C:\Program Files\Git\usr\bin",
+    r"C:\Program Files (x86)\Git\usr\bin",
+]
+
+
+# Process-wide registry of the external tools this host has, so components
+# can check for a tool without spawning a probe each time one is constructed.
+#
+# Each tool is resolved on first use: found on `PATH` (no process spawned),
+# then run once with `--version` to check it works. With a cache directory,
+# results are persisted per host and reused by later runs for as long as the
+# executable on `PATH` is the same file, unchanged; only new or changed tools
+# are run again.
+class Capabilities:
+    def __init__(self, cache=None):
+        """
+        :param cache: Directory to persist probe results in, per host, or
+                      None to keep them in memory only.
+        """
+        self._file = None
+        if cache:
+            self._file = os.path.join(cache, f"{socket.gethostname()}.json")
+        self._known = self._load()
+        self._tools = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not self._file:
+            return {}
+        try:
+            with open(self._file, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self):
+        if not self._file:
+            return
+        util.write_atomic(self._file,
+                          json.dumps(self._known, indent=2, sort_keys=True))
+
+    def _which(self, exe):
+        path = shutil.which(exe)
+        if path is None and util.is_windows():
+            path = shutil.which(exe, path=os.pathsep.join(_WINDOWS_PATHS))
+        return path
+
+    def _probe(self, name):
+        """Find and check a tool, reusing a persisted result if still valid."""
+        for exe in TOOLS.get(name, [name]):
+            path = self._which(exe)
+            if path is None:
+                continue
+            stat = os.stat(path)
+            key = [stat.st_mtime_ns, stat.st_size]
+            known = self._known.get(name)
+            if known and known['path'] == path and known['stat'] == key:
+                return known
+
+            try:
+                result = subprocess.run([path, "--version"],
+                                        capture_output=True, text=True,
+                                        encoding='utf-8', errors='replace')
+            except OSError:
+                continue
+            if result.returncode != 0:
+                print(f"Capabilities: {path} --version failed: "
+                      f"{result.stderr}")
+                continue
+            lines = (result.stdout or result.stderr or "").splitlines()
+            tool = {
+                'path': path,
+                'version': lines[0].strip() if lines else "",
+                'stat': key,
+            }
+            self._known[name] = tool
+            self._save()
+            return tool
+        return None
+
+    def get(self, name):
+        """
+        Return a tool's `path` and `version`, or None if the host doesn't
+        have it.
+        """
+        with self._lock:
+            if name not in self._tools:
+                self._tools[name] = self._probe(name)
+                tool = self._tools[name]
+                print(f"Capabilities: {name}: " +
+                      (f"{tool['path']} ({tool['version']})" if tool
+                       else "not found"))
+            return self._tools[name]
+
+    def has(self, name):
+        return self.get(name) is not None
+
+    def path(self, name):
+        tool = self.get(name)
+        return tool['path'] if tool else None
+
+    def resolve(self):
+        """Resolve every known tool, e.g. to report on the host up front."""
+        return {name: self.get(name) for name in TOOLS}
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def capabilities():
+    """
+    Return the process's registry, persisted under `CAPABILITIES_CACHE` if
+    that's set.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = Capabilities(os.getenv('CAPABILITIES_CACHE'))
+        return _registry
+
+
+def reset_capabilities():
+    """Forget every resolved tool, so the next lookup probes again."""
+    global _registry
+    with _registry_lock:
+        _registry = None
@@ -1,19 +1,105 @@
 from tools import util
 
 from core.shell import Shell
+from core.http_cache import HttpCache
+from core.manifest import Manifest
+from core.scheduler import RequestScheduler
 
 import os
+import csv
+import json
 import fnmatch
 import re
 import platform
+import time
+import shutil
+import tarfile
+import tempfile
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse, parse_qs
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 from datetime import datetime
 
 
+# GitHub(R)'s maximum page size for repo listings.
+_PER_PAGE = 100
+
+# Most results GitHub(R)'s search API returns for one query.
+_SEARCH_CAP = 1000
+
+# Clone strategies, selectable per milestone by the `clone` key. "tarball"
+# downloads the tree through the API instead of cloning.
+_CLONE_STRATEGIES = ("full", "shallow", "blobless", "sparse", "tarball")
+
+# Sources the grader needs; a sparse clone or tarball download only checks
+# these out (plus the milestone's instructor files).
+_SPARSE_PATTERNS = ["*.cpp", "*.hpp", "*.h", "CMakeLists.txt"]
+
+
+def load_roster(path):
+    """
+    Read a roster of GitHub(R) usernames.
+
+    JSON rosters are a list of usernames, or of objects with a `username`.
+    CSV rosters use the `username` column if there's a header with one,
+    otherwise the first column.
+
+    :return: The usernames, in roster order, without duplicates.
+    """
+    with open(path, "r", newline="") as file:
+        if path.endswith(".json"):
+            entries = json.load(file)
+            usernames = [
+                e['username'] if isinstance(e, dict) else e for e in entries
+            ]
+        else:
+            rows = [row for row in csv.reader(file) if row]
+            column = 0
+            if rows and "username" in [c.strip().lower() for c in rows[0]]:
+                column = [c.strip().lower() for c in rows[0]].index("username")
+                rows = rows[1:]
+            usernames = [row[column] for row in rows]
+
+    usernames = [u.strip() for u in usernames if u and u.strip()]
+    return list(dict.fromkeys(usernames))
+
+
+def make_session(headers, pool_size=10, retries=3):
+    """
+    Build the pooled HTTP session every GitHub(R) API call goes through.
+
+    Connections are kept alive and reused across requests and threads, so
+    only the first request to a host pays for the TLS handshake. The adapter
+    only retries connection level failures (a refused connect, a dropped
+    read); status codes are left to `RequestScheduler`, which knows about
+    the rate limit.
+
+    :param headers: Headers to send with every request.
+    :param pool_size: Connections to keep per host; at least as many as
+                      requests made concurrently.
+    :param retries: Connection level retries.
+    """
+    session = requests.Session()
+    session.headers.update(headers)
+    session.headers['Accept-Encoding'] = "gzip, deflate"
+
+    retry = Retry(total=retries, connect=retries, read=retries, status=0,
+                  backoff_factor=0.5, allowed_methods=["GET"],
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size,
+                          max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 class Fetcher:
-    def __init__(self, milestone, config, path='', date=datetime(2025, 1, 1)):
+    def __init__(self, milestone, config, path='', date=datetime(2025, 1, 1),
+                 workers=None, incremental=None, refresh=False, roster=None):
         self._shell = Shell()
         self._config = config
 
@@ -34,8 +120,52 @@ class Fetcher:
         self._init_timestamp(date)
         self._init_req()
         self._init_path(path)
+        self._init_cache(refresh)
+
+        self._init_clone()
+        self._init_reference()
+
+        # Number of concurrent clones. The CLI flag takes precedence over the
+        # milestone config.
+        if workers is None:
+            workers = self._config.get('fetch', {}).get('workers', 4)
+        self._workers = max(1, int(workers))
+        print(f"Fetcher:\tclone workers:\t{self._workers}")
+        self._init_session()
+        self._init_ssh()
+
+        # Size guard: repos over `max_size` KB are "flag"ged, cloned
+        # "shallow" or "sparse", or "defer"red to the end of the queue.
+        fetch = self._config.get('fetch', {})
+        self._max_size = fetch.get('max_size', 0)
+        self._oversize_action = fetch.get('oversize', "defer")
+        if self._oversize_action not in ("flag", "shallow", "sparse", "defer"):
+            raise ValueError(
+                f"Unknown oversize action: {self._oversize_action}. " +
+                f"Expected one of: flag, shallow, sparse, defer"
+            )
+
+        # Roster of expected usernames. With one, repos are requested by
+        # name instead of discovered.
+        self._roster = []
+        self._missing = []
+        roster = roster or fetch.get('roster')
+        if roster:
+            self._roster = load_roster(roster)
+            print(f"Fetcher:\troster:\t{roster}:\t{len(self._roster)}")
 
-        self._clone = self._config['clone']
+        # Named deadlines (e.g. "initial", "resubmission") to snapshot each
+        # clone at, as `{name: timestamp}`.
+        self._deadlines = self._config.get('deadlines', {})
+
+        # Incremental mode updates existing clones in place and skips repos
+        # that haven't been pushed to since the last fetch.
+        if incremental is None:
+            incremental = self._config.get('fetch', {}).get(
+                'incremental', False
+            )
+        self._incremental = incremental
+        print(f"Fetcher:\tincremental:\t{self._incremental}")
 
     def _init_timestamp(self, date):
         # datetime(year, month, day)
@@ -54,89 +184,996 @@ class Fetcher:
         }
 
         self._org = self._config['org']
-        self._url = f"https://api.github.com/orgs/{self._org}/repos"
+        # Overridable, to point Fetcher at a local stand-in for the API.
+        self._api = os.getenv('GITHUB_API', "https://api.github.com")
+        self._url = f"{self._api}/orgs/{self._org}/repos"
+        self._search_url = f"{self._api}/search/repositories"
 
         glob = self._config['glob']
         self._glob = f"{self._fmilestone}-{glob}-*"
 
+        # Most listing pages to request concurrently. The scheduler lowers
+        # this as the rate limit budget runs low.
+        fetch = self._config.get('fetch', {})
+        self._list_workers = fetch.get('list_workers', 8)
+        # "list" walks the whole org; "search" asks the API for candidates.
+        self._discovery = fetch.get('discovery', "list")
+        self._scheduler = RequestScheduler(
+            concurrency=self._list_workers,
+            retries=fetch.get('retries', 5)
+        )
+
+        # (connect, read) timeouts, in seconds, so a hung socket can't stall
+        # the run.
+        self._timeout = tuple(fetch.get('timeout', (5, 30)))
+
+    def _init_clone(self):
+        # `clone` is either a bool (`true` is a full clone) or the name of a
+        # clone strategy.
+        clone = self._config['clone']
+        self._clone = bool(clone)
+        self._strategy = "full" if clone is True else clone
+        if self._clone and self._strategy not in _CLONE_STRATEGIES:
+            raise ValueError(
+                f"Unknown clone strategy: {self._strategy}. " +
+                f"Expected one of: {', '.join(_CLONE_STRATEGIES)}"
+            )
+        self._depth = int(self._config.get('fetch', {}).get('depth', 1))
+        print(f"Fetcher:\tclone strategy:\t{self._strategy}")
+
+    def _init_ssh(self):
+        # git command prefix. While a multiplexed SSH master is up, it points
+        # git's ssh at the master's control socket.
+        self._git = "git"
+        self._ssh_dir = None
+        self._ssh_host = None
+
+        # OpenSSH's connection multiplexing isn't available on Windows.
+        if (not self._config.get('fetch', {}).get('ssh_multiplex', True) or
+            util.is_windows()):
+            return
+        self._ssh_host = self._ssh_remote_host()
+
+    def _ssh_remote_host(self):
+        """Return the `[user@]host` of an SSH remote, or None."""
+        remote = self._remote("repo")
+        if "://" in remote:
+            url = urlparse(remote)
+            if url.scheme != "ssh":
+                return None
+            user = f"{url.username}@" if url.username else ""
+            return user + url.hostname
+        # scp-like syntax: `[user@]host:path`.
+        reg = re.match(r"^([^/:]+):", remote)
+        return reg[1] if reg else None
+
+    def _ssh_opts(self, persist):
+        return (f"-o ControlMaster=auto " +
+                f"-o ControlPath={self._ssh_dir}/%C " +
+                f"-o ControlPersist={persist}")
+
+    def _start_ssh(self):
+        """
+        Open one multiplexed SSH master connection for the run, and point
+        every git command at it, so concurrent clones and fetches share one
+        key exchange instead of each doing their own.
+
+        If the master can't be opened up front, the first git command to
+        connect becomes the master instead (`ControlMaster=auto`).
+        """
+        if not self._ssh_host or self._ssh_dir:
+            return
+        # Short, private directory: control socket paths are length limited.
+        self._ssh_dir = tempfile.mkdtemp(prefix="gc-ssh-")
+        stdout, stderr, code = self._shell.cmd(
+            f"ssh {self._ssh_opts(600)} -o BatchMode=yes -fN {self._ssh_host}"
+        )
+        if code != 0:
+            print(f"Fetcher:\tssh master failed, continuing:\t{stderr}")
+        else:
+            print(f"Fetcher:\tssh master:\t{self._ssh_host}")
+        self._git = f"GIT_SSH_COMMAND='ssh {self._ssh_opts(60)}' git"
+
+    def _stop_ssh(self):
+        """Tear down the multiplexed SSH master connection."""
+        if not self._ssh_dir:
+            return
+        self._shell.cmd(
+            f"ssh -o ControlPath={self._ssh_dir}/%C -O exit {self._ssh_host}"
+        )
+        shutil.rmtree(self._ssh_dir, ignore_errors=True)
+        self._ssh_dir = None
+        self._git = "git"
+
+    def _init_session(self):
+        # Sized for whichever is larger: concurrent listing pages or
+        # concurrent tarball downloads.
+        self._session = make_session(
+            self._headers, pool_size=max(self._list_workers, self._workers)
+        )
+
+    def _init_reference(self):
+        # Per-org bare repository that clones borrow objects from (via git
+        # alternates), so objects shared between students' repos and across
+        # milestones, e.g. from the starter templates, are stored once.
+        fetch = self._config.get('fetch', {})
+        self._reference = None
+        if fetch.get('reference', False):
+            self._reference = os.path.abspath(
+                f"repos/.reference/{self._org}.git"
+            )
+            print(f"Fetcher:\treference:\t{self._reference}")
+        # Template repos to seed the reference with before cloning.
+        self._reference_seed = fetch.get('reference_seed', [])
+        # Copy borrowed objects into each clone, instead of leaving it
+        # dependent on the reference. Saves bandwidth, but not disk.
+        self._dissociate = fetch.get('dissociate', False)
+
+    def _init_cache(self, refresh):
+        # Conditional-request cache for the org listing. `refresh` ignores
+        # existing entries, forcing a full re-download.
+        fetch = self._config.get('fetch', {})
+        self._cache = None
+        if fetch.get('cache', True):
+            self._cache = HttpCache(ttl=fetch.get('cache_ttl', 86400),
+                                    refresh=refresh)
+
     def _init_path(self, path):
         if path != '':
             self._path = path
         else:
             self._path = f'repos/{self._pmilestone}'
 
-    def fetch(self):
-        if self._config['fetch']['clear']:
-            stdout, stderr, code = self._shell.cmd(
-                    f"rm -rf {self._path} && " +
-                    f"mkdir {self._path}"
+    def _get(self, url, params, what, missing_ok=False):
+        """
+        Make a paged GET to the API. If the page is cached, the request is
+        made conditional and a `304 Not Modified` is served from the cache.
+
+        Requests go through the rate limit aware scheduler, which retries
+        server errors and rate limiting. A page that still fails raises, as
+        carrying on would silently truncate the results.
+
+        :param what: What's being requested, for messages.
+        :param missing_ok: Return `(None, {})` on a `404`, instead of raising.
+        :return: A tuple of the parsed body and its `Link` header relations.
+        """
+        entry = self._cache.get(url, params) if self._cache else None
+
+        headers = self._cache.headers(entry) if entry else {}
+
+        # Search has its own (much smaller) rate limit budget.
+        resource = "search" if url == self._search_url else "core"
+        response = self._scheduler.request(
+            lambda: self._session.get(url, headers=headers, params=params,
+                                      timeout=self._timeout),
+            resource
+        )
+        if response.status_code == 304 and entry:
+            print(f"Fetcher:\t_get:\t{what}:\tnot modified")
+            self._cache.touch(url, params, entry)
+            return entry['body'], entry['links']
+        if response.status_code == 404 and missing_ok:
+            return None, {}
+        if response.status_code != 200:
+            raise RuntimeError(
+                f"Fetcher: {what} failed: " +
+                f"bad response status code: {response.status_code}"
             )
 
-        # Don't paginate (GitHub(R)'s API paginates by default).
-        page = 1
-        while True:
-            response = requests.get(self._url, headers=self._headers,
-                                    params={'page' : page})
-            if response.status_code != 200:
-                print(f"bad response status code: {response.status_code}")
-                break
-
-            repos = response.json()
-            if not repos:
-                print(f"no json response")
-                break
-
-            print(response)
-
-            for repo in repos:
-                # Skip repos that are older than our specified minimum
-                # year/month.
-                created_at = datetime.strptime(repo['created_at'],
-                                               "%Y-%m-%dT%H:%M:%SZ")
-                #print(f'Fetcher:\tfetch:\tcreated_at:\t{created_at}')
-                pushed_at = datetime.strptime(repo['pushed_at'],
-                                              "%Y-%m-%dT%H:%M:%SZ")
-                #print(f'Fetcher:\tfetch:\tpushed_at before:\t{pushed_at}')
-
-                if (created_at.year < self._mindate.year and
-                    created_at.month < self._mindate.month):
+        body = response.json()
+        if self._cache:
+            self._cache.put(url, params, response, body)
+        return body, response.links
+
+    def _get_page(self, page):
+        """
+        Request a single page of the org's repo listing.
+
+        :param page: The 1-based page number.
+        :return: A tuple of the page's repos and its `Link` header relations.
+        """
+        params = {'page': page, 'per_page': _PER_PAGE}
+        return self._get(self._url, params, f"listing page {page}")
+
+    def _last_page(self, links):
+        """Read the last page number from a page's `Link` header relations."""
+        last = links.get('last', {}).get('url')
+        if not last:
+            return 1
+        page = parse_qs(urlparse(last).query).get('page', ['1'])[0]
+        return int(page)
+
+    def _paginate(self, get_page, on_page=None, first=None):
+        """
+        Collect every page of a paged API request.
+
+        The first page is requested on its own to learn the last page number
+        from the `Link` header; the remaining pages are then requested
+        concurrently. Pages are merged in page order, so the result is stable
+        regardless of which request finishes first.
+
+        :param get_page: Returns a page's repos and `Link` header relations.
+        :param on_page: Optional callback, called with each page's repos as
+                        soon as the page arrives.
+        :param first: The first page's result, if already requested.
+        """
+        result = first or get_page(1)
+        pages = {1: result[0]}
+        if on_page:
+            on_page(pages[1])
+        last = self._last_page(result[1])
+        print(f"Fetcher:\t_paginate:\tpages:\t{last}")
+
+        if last > 1:
+            rest = range(2, last + 1)
+            workers = max(1, min(self._list_workers, len(rest)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(get_page, page): page for page in rest
+                }
+                for future in as_completed(futures):
+                    page = futures[future]
+                    pages[page] = future.result()[0]
+                    if on_page:
+                        on_page(pages[page])
+
+        repos = []
+        for page in sorted(pages):
+            repos.extend(pages[page])
+        return repos
+
+    def _list_repos(self, on_page=None):
+        """List every repo in the org."""
+        return self._paginate(self._get_page, on_page)
+
+    def _search_params(self, page):
+        # Search matches name terms loosely; `_match()` still applies the
+        # exact glob and cutoffs to whatever comes back.
+        date = self._push_mindate.strftime('%Y-%m-%d')
+        q = (f"org:{self._org} {self._fmilestone}-{self._config['glob']} " +
+             f"in:name pushed:>={date}")
+        return {'q': q, 'page': page, 'per_page': _PER_PAGE}
+
+    def _search_page(self, page):
+        body, links = self._get(self._search_url, self._search_params(page),
+                                f"search page {page}")
+        return body['items'], links
+
+    def _search_repos(self, on_page=None):
+        """
+        Find candidate repos with a server-side search on the milestone's
+        name prefix and push cutoff, so the rest of the org (every other
+        milestone, every other term) is never downloaded.
+
+        Raises `LookupError` before reporting any repos if search can't give
+        a complete answer, so the caller can fall back to the full listing.
+        """
+        try:
+            body, links = self._get(self._search_url, self._search_params(1),
+                                    "search page 1")
+        except RuntimeError as e:
+            raise LookupError(f"search unavailable: {e}") from e
+
+        # Search results are capped, and may time out server side.
+        if body.get('incomplete_results'):
+            raise LookupError("search results incomplete")
+        if body.get('total_count', 0) > _SEARCH_CAP:
+            raise LookupError(
+                f"search matched {body['total_count']} repos, over the " +
+                f"{_SEARCH_CAP} result cap"
+            )
+        print(f"Fetcher:\t_search_repos:\tmatched:\t{body['total_count']}")
+
+        return self._paginate(self._search_page, on_page,
+                              first=(body['items'], links))
+
+    def _roster_repos(self, on_page=None):
+        """
+        Request each roster student's expected repo directly and
+        concurrently, instead of enumerating the org. Students without a repo
+        are collected in `self._missing`.
+
+        :return: The found repos, in roster order.
+        """
+        def get(username):
+            name = f"{self._fmilestone}-{self._config['glob']}-{username}"
+            url = f"{self._api}/repos/{self._org}/{name}"
+            return self._get(url, {}, f"repo {name}", missing_ok=True)[0]
+
+        found = {}
+        self._missing = []
+        workers = max(1, min(self._list_workers, len(self._roster)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(get, username): username
+                for username in self._roster
+            }
+            for future in as_completed(futures):
+                username = futures[future]
+                repo = future.result()
+                if repo is None:
+                    print(f"Fetcher:\tmissing:\t{username}")
+                    self._missing.append(username)
                     continue
+                found[username] = repo
+                if on_page:
+                    on_page([repo])
+
+        self._missing.sort(key=self._roster.index)
+        print(f"Fetcher:\t_roster_repos:\tfound:\t{len(found)}\t" +
+              f"missing:\t{len(self._missing)}")
+        return [found[u] for u in self._roster if u in found]
+
+    def _discover(self, on_page=None):
+        """
+        Find the org's repos: from the roster if there is one, otherwise with
+        search if configured, falling back to the full listing when search
+        isn't available.
+        """
+        if self._roster:
+            return self._roster_repos(on_page)
+        if self._discovery == "search":
+            try:
+                return self._search_repos(on_page)
+            except LookupError as e:
+                print(f"Fetcher:\t{e}:\tfalling back to full listing")
+        return self._list_repos(on_page)
+
+    def _match(self, repo, cutoff=True):
+        """
+        Check a listed repo against the milestone glob and date cutoffs.
+
+        :param cutoff: Apply the date cutoffs. Roster repos skip them: an
+                       expected student's repo is graded however old it is.
+        """
+        if not cutoff:
+            return fnmatch.fnmatch(repo['name'], self._glob)
+
+        # Skip repos that are older than our specified minimum year/month.
+        created_at = datetime.strptime(repo['created_at'],
+                                       "%Y-%m-%dT%H:%M:%SZ")
+        pushed_at = datetime.strptime(repo['pushed_at'],
+                                      "%Y-%m-%dT%H:%M:%SZ")
+
+        if (created_at.year < self._mindate.year and
+            created_at.month < self._mindate.month):
+            return False
+
+        if (pushed_at < self._push_mindate):
+            return False
+
+        return fnmatch.fnmatch(repo['name'], self._glob)
+
+    def _head(self, name):
+        """Return a clone's HEAD sha, or None."""
+        stdout, stderr, code = self._shell.cmd(
+            f"git -C {self._path}/{name} rev-parse HEAD"
+        )
+        return stdout.strip() if code == 0 else None
+
+    def _record(self, repo, result, prev):
+        """
+        Build a repo's manifest record from its fetch result. A failed fetch
+        keeps the previous record's HEAD and `pushed_at`, so the clone stays
+        usable and the next incremental fetch retries it.
+        """
+        name = repo['name']
+        ok = result['status'] != "failed"
+        return {
+            'name': name,
+            'username': util.repo_username(self._fmilestone,
+                                           self._config['glob'], name),
+            'path': f"{self._path}/{name}",
+            'head': result.get('head') if ok else prev.get('head'),
+            'pushed_at': repo['pushed_at'] if ok else prev.get('pushed_at'),
+            'status': result['status'],
+            'throttled': result.get('throttled'),
+        }
+
+    def _snapshot_path(self, deadline):
+        return f"{self._path}-{deadline}"
+
+    def _worktree_ok(self, snap):
+        """Check a snapshot worktree still links to its clone."""
+        try:
+            with open(os.path.join(snap, ".git")) as file:
+                gitdir = file.read().strip().removeprefix("gitdir: ")
+        except OSError:
+            return False
+        return os.path.isdir(os.path.join(snap, gitdir))
+
+    def _snapshot_repo(self, record, deadline, timestamp):
+        """
+        Check out a worktree of a clone at its last commit before a deadline.
+        Worktrees share the clone's objects, so a snapshot costs a checkout,
+        not another clone.
+
+        :return: The snapshot's manifest record.
+        """
+        name = record['name']
+        dir = record['path']
+        snap = os.path.abspath(f"{self._snapshot_path(deadline)}/{name}")
+        snapshot = dict(record, path=f"{self._snapshot_path(deadline)}/{name}",
+                        head=None, status="missing")
+
+        stdout, stderr, code = self._shell.cmd(
+            f"git -C {dir} rev-list -n 1 --before='{timestamp}' HEAD"
+        )
+        sha = stdout.strip()
+        if code != 0 or not sha:
+            if os.path.isfile(os.path.join(dir, ".git", "shallow")):
+                # The history just isn't here: not the same as no submission.
+                print(f"Fetcher:\t{deadline}:\tshallow clone, no history:\t" +
+                      f"{name}")
+                snapshot['status'] = "failed"
+                return snapshot
+            # Nothing committed before the deadline: no submission.
+            print(f"Fetcher:\t{deadline}:\tno commit before deadline:\t{name}")
+            return snapshot
+
+        if os.path.isdir(snap) and not self._worktree_ok(snap):
+            # Left behind by a clone that's since been cleared: recreate it.
+            shutil.rmtree(snap, ignore_errors=True)
+        if os.path.isdir(snap):
+            cmd = f"{self._git} -C {snap} checkout -q --detach {sha}"
+        else:
+            cmd = (f"git -C {dir} worktree prune && " +
+                   f"{self._git} -C {dir} worktree add -q --detach {snap} " +
+                   f"{sha}")
+        stdout, stderr, code = self._shell.cmd(cmd)
+        if code != 0:
+            print(f"Fetcher:\t{deadline}:\tsnapshot failed:\t{name}:\t{stderr}")
+            snapshot['status'] = "failed"
+            return snapshot
+
+        snapshot['head'] = sha
+        snapshot['status'] = "snapshot"
+        return snapshot
 
-                if (pushed_at < self._push_mindate):
+    def _snapshot_tarball(self, record, deadline, timestamp):
+        """
+        Download a repo's tree at its last commit before a deadline, for the
+        tarball strategy, which has no local history to check out from.
+
+        :return: The snapshot's manifest record.
+        """
+        name = record['name']
+        path = f"{self._snapshot_path(deadline)}/{name}"
+        snapshot = dict(record, path=path, head=None, status="missing")
+
+        url = f"{self._api}/repos/{self._org}/{name}/commits"
+        try:
+            commits = self._get(url, {'until': timestamp, 'per_page': 1},
+                                f"{name} commits before {deadline}",
+                                missing_ok=True)[0]
+        except (RuntimeError, requests.RequestException) as e:
+            print(f"Fetcher:\t{deadline}:\tsnapshot failed:\t{name}:\t{e}")
+            snapshot['status'] = "failed"
+            return snapshot
+        if not commits:
+            # Nothing committed before the deadline: no submission.
+            print(f"Fetcher:\t{deadline}:\tno commit before deadline:\t{name}")
+            return snapshot
+
+        sha = commits[0]['sha']
+        result = self._download_repo({'name': name}, ref=sha, dir=path)
+        if result['status'] == "failed":
+            snapshot['status'] = "failed"
+            return snapshot
+        snapshot['head'] = sha
+        snapshot['status'] = "snapshot"
+        return snapshot
+
+    def _snapshot(self, records):
+        """
+        Snapshot every fetched clone at each configured deadline, into
+        `<path>-<deadline>/`, with its own manifest for Reporter2.
+
+        :return: The snapshot records, as `{deadline: {name: record}}`.
+        """
+        if self._strategy == "shallow":
+            print(f"Fetcher:\tdeadline snapshots need history: skipping " +
+                  f"for clone strategy {self._strategy}")
+            return {}
+        # Tarballs have no history here: download each deadline's tree.
+        snapshot = self._snapshot_repo
+        if self._strategy == "tarball":
+            snapshot = self._snapshot_tarball
+
+        fetched = [r for r in records.values() if r.get('head')]
+        snapshots = {}
+        # Checking out a partial clone at an older commit fetches its blobs.
+        if self._strategy != "tarball":
+            self._start_ssh()
+        try:
+            with ThreadPoolExecutor(max_workers=self._workers) as pool:
+                for deadline, timestamp in self._deadlines.items():
+                    print(f"Fetcher:\tsnapshot:\t{deadline}:\t{timestamp}")
+                    snaps = pool.map(
+                        lambda r: snapshot(r, deadline, timestamp),
+                        fetched
+                    )
+                    snapshots[deadline] = {s['name']: s for s in snaps}
+                    Manifest(self._snapshot_path(deadline)).save(
+                        snapshots[deadline]
+                    )
+
+                    missing = [n for n, s in snapshots[deadline].items()
+                               if s['status'] != "snapshot"]
+                    print(f"Fetcher:\t{deadline}:\tsnapshots:\t" +
+                          f"{len(fetched) - len(missing)}")
+                    for name in missing:
+                        print(f"\t{name}\t" +
+                              f"({snapshots[deadline][name]['status']})")
+        finally:
+            self._stop_ssh()
+        return snapshots
+
+    def _run_git(self, name, status, cmd):
+        """
+        Run a git command for a single repo and time it.
+
+        :param name: The repo's name.
+        :param status: The status to record on success.
+        :param cmd: The git command to run.
+        :return: A status record with the repo's name, status, exit code and
+                 duration in seconds.
+        """
+        start = time.monotonic()
+        stdout, stderr, code = self._shell.cmd(cmd)
+        duration = time.monotonic() - start
+
+        if code != 0:
+            status = "failed"
+            print(f"Fetcher:\tgit stderr:\t{name}:\t{stderr}")
+        print(f"Fetcher:\t{status}:\t{name}\t(code {code}, {duration:.2f}s)")
+
+        return {
+            'name': name,
+            'status': status,
+            'code': code,
+            'duration': duration,
+        }
+
+    def _remote(self, name):
+        # `fetch.remote` is a format string with `{org}` and `{name}` fields,
+        # e.g. to clone from a local stand-in with `file://` URLs.
+        remote = self._config.get('fetch', {}).get(
+            'remote', "git@github.com:{org}/{name}.git"
+        )
+        return remote.format(org=self._org, name=name)
+
+    def _patterns(self):
+        return _SPARSE_PATTERNS + self._config.get('files', [])
+
+    def _sparse_patterns(self):
+        return " ".join(f"'{pattern}'" for pattern in self._patterns())
+
+    def _clone_cmd(self, name, strategy):
+        """Build the clone command for a repo under a clone strategy."""
+        dir = f"{self._path}/{name}"
+        remote = self._remote(name)
+
+        clone = f"{self._git} clone "
+        if self._reference:
+            clone += f"--reference-if-able {self._reference} "
+            if self._dissociate:
+                clone += "--dissociate "
+
+        if strategy == "shallow":
+            return f"{clone}--depth {self._depth} {remote} {dir}"
+        if strategy == "blobless":
+            return f"{clone}--filter=blob:none {remote} {dir}"
+        if strategy == "sparse":
+            # Blobless, so only the blobs of checked out paths are fetched.
+            return (
+                f"{clone}--filter=blob:none --no-checkout {remote} {dir} && " +
+                f"{self._git} -C {dir} sparse-checkout set --no-cone " +
+                f"{self._sparse_patterns()} && " +
+                f"{self._git} -C {dir} checkout"
+            )
+        return f"{clone}{remote} {dir}"
+
+    def _prepare_reference(self):
+        """Create the reference repository and fetch its seed repos into it."""
+        if not os.path.isdir(self._reference):
+            stdout, stderr, code = self._shell.cmd(
+                f"git init --bare -q {self._reference}"
+            )
+            if code != 0:
+                print(f"Fetcher:\tFailed to create reference:\t{stderr}")
+                self._reference = None
+                return
+
+        for name in self._reference_seed:
+            stdout, stderr, code = self._shell.cmd(
+                f"{self._git} -C {self._reference} fetch -q " +
+                f"{self._remote(name)} " +
+                f"+refs/heads/*:refs/remotes/{name}/*"
+            )
+            if code != 0:
+                print(f"Fetcher:\tFailed to seed reference with {name}:\t" +
+                      f"{stderr}")
+
+    def _absorb_reference(self, results):
+        """
+        Fetch this run's clones into the reference, so the next milestone's
+        clones can borrow their objects. These are local fetches, so they're
+        cheap, but they run serially as they all write to the reference.
+
+        Only full clones are absorbed: fetching from a shallow or partial
+        clone would leave the reference shallow or missing blobs, and git
+        refuses to borrow from a shallow reference.
+        """
+        if self._strategy != "full":
+            return
+
+        for r in results:
+            if r['status'] not in ("cloned", "updated"):
+                continue
+            name = r['name']
+            dir = os.path.abspath(f"{self._path}/{name}")
+            stdout, stderr, code = self._shell.cmd(
+                f"git -C {self._reference} fetch -q {dir} " +
+                f"+HEAD:refs/remotes/{name}/HEAD"
+            )
+            if code != 0:
+                print(f"Fetcher:\tFailed to absorb {name} into reference:\t" +
+                      f"{stderr}")
+
+    def _clone_repo(self, repo, strategy):
+        """Clone a single repo into the milestone path."""
+        name = repo['name']
+        print(f"Fetcher:\tAttempting to clone {name}")
+        return self._run_git(name, "cloned", self._clone_cmd(name, strategy))
+
+    def _update_repo(self, repo, strategy):
+        """Bring an existing clone up to date with the remote's HEAD."""
+        name = repo['name']
+        print(f"Fetcher:\tAttempting to update {name}")
+        dir = f"{self._path}/{name}"
+        depth = f"--depth {self._depth} " if strategy == "shallow" else ""
+        return self._run_git(
+            name, "updated",
+            f"{self._git} -C {dir} fetch {depth}origin HEAD && " +
+            f"{self._git} -C {dir} reset --hard FETCH_HEAD"
+        )
+
+    def _extract(self, fileobj, dir):
+        """
+        Stream-extract a gzipped tarball of a repo into `dir`, one member at
+        a time, keeping only the files the grader needs.
+
+        :return: The commit sha the tarball was made from, or None.
+        """
+        os.makedirs(dir, exist_ok=True)
+        patterns = self._patterns()
+        # `r|gz` reads the archive as a stream; it's never held in memory.
+        with tarfile.open(fileobj=fileobj, mode="r|gz") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                # Strip the archive's `<org>-<repo>-<sha>/` top directory.
+                parts = member.name.split("/", 1)
+                if len(parts) < 2:
+                    continue
+                rel = os.path.normpath(parts[1])
+                if rel.startswith("..") or os.path.isabs(rel):
+                    print(f"Fetcher:\tskipping unsafe path:\t{member.name}")
+                    continue
+                if not any(fnmatch.fnmatch(os.path.basename(rel), pattern)
+                           for pattern in patterns):
                     continue
 
-                print(f'Fetcher:\tfetch:\tpushed_at after:\t{pushed_at}')
+                dest = os.path.join(dir, rel)
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                with open(dest, "wb") as fh:
+                    shutil.copyfileobj(tar.extractfile(member), fh)
 
-                if fnmatch.fnmatch(repo['name'], self._glob):
-                    if self._clone:
-                        # xxx log
-                        print(
-                            f'Fetcher:\tAttempting to clone {repo['name']}'
-                        )
-
-                        stdout, stderr, code = self._shell.cmd(
-                            f"cd {self._path} && " +
-                            f"git clone git@github.com:" +
-                            f"{self._org}/{repo['name']}.git && " +
-                            f"cd -"
-                        )
-                        print(f'Fetcher:\tfetch:\tgit clone stdout:\t{stdout}')
+            # The global pax header's comment holds the commit sha.
+            return tar.pax_headers.get('comment')
 
-                        # xxx log
-                        if code == 0:
-                            # Push an extra newline to split entries.
-                            print(
-                                f"Fetcher:\tSuccessfully cloned {repo['name']}"
-                            )
-                        else:
-                            # Push an extra newline to split entries.
-                            print(f"Fetcher:\tFailed to clone\t{repo['name']}")
+    def _download_repo(self, repo, ref=None, dir=None):
+        """
+        Download a single repo's tree as a tarball through the API, instead
+        of cloning it. Needs no SSH keys and skips git's pack negotiation.
+
+        :param ref: The commit-ish to download; defaults to the default
+                    branch.
+        :param dir: Where to extract it; defaults to the repo's directory in
+                    the milestone path.
+        """
+        name = repo['name']
+        dir = dir or os.path.join(self._path, name)
+        url = f"{self._api}/repos/{self._org}/{name}/tarball"
+        if ref:
+            url += f"/{ref}"
+        print(f"Fetcher:\tAttempting to download {name}")
 
+        start = time.monotonic()
+        code = 0
+        head = None
+        try:
+            response = self._scheduler.request(
+                lambda: self._session.get(url, stream=True,
+                                          timeout=self._timeout)
+            )
+            with response:
+                if response.status_code != 200:
+                    raise RuntimeError(
+                        f"bad response status code: {response.status_code}"
+                    )
+                response.raw.decode_content = True
+                # Replace, don't merge with, a previous download.
+                shutil.rmtree(dir, ignore_errors=True)
+                head = self._extract(response.raw, dir)
+        except (RuntimeError, requests.RequestException, tarfile.TarError,
+                OSError) as e:
+            code = 1
+            print(f"Fetcher:\tdownload error:\t{name}:\t{e}")
+        duration = time.monotonic() - start
+
+        status = "downloaded" if code == 0 else "failed"
+        print(f"Fetcher:\t{status}:\t{name}\t(code {code}, {duration:.2f}s)")
+        return {
+            'name': name,
+            'status': status,
+            'code': code,
+            'duration': duration,
+            'head': head,
+        }
+
+    def _fetch_repo(self, repo, prev, strategy=None, update=None):
+        """
+        Fetch a single repo: clone or download it, or in incremental mode
+        update an existing copy, or skip it if it hasn't changed since the
+        last fetch.
+
+        :param prev: The repo's manifest record from the last fetch, or {}.
+        :param strategy: Clone strategy, if not the milestone's.
+        :param update: Whether to update an existing copy in place, if not
+                       the milestone's incremental setting.
+        """
+        name = repo['name']
+        strategy = strategy or self._strategy
+        update = self._incremental if update is None else update
+        dir = os.path.join(self._path, name)
+        tarball = strategy == "tarball"
+        exists = os.path.isdir(dir if tarball else os.path.join(dir, ".git"))
+
+        if update and exists:
+            if prev.get('pushed_at') == repo['pushed_at']:
+                print(f"Fetcher:\tunchanged:\t{name}")
+                return {
+                    'name': name,
+                    'status': "unchanged",
+                    'code': 0,
+                    'duration': 0.0,
+                    'head': prev.get('head'),
+                }
+
+        if tarball:
+            return self._download_repo(repo)
+
+        if update and exists:
+            result = self._update_repo(repo, strategy)
+        else:
+            result = self._clone_repo(repo, strategy)
+
+        if result['status'] != "failed":
+            result['head'] = self._head(name)
+        return result
+
+    def _print_summary(self, results):
+        print(util.fmtout("Fetcher: Summary"))
+        for status in ("cloned", "downloaded", "updated", "unchanged",
+                       "failed"):
+            count = sum(1 for r in results if r['status'] == status)
+            if count:
+                print(f"Fetcher:\t{status}:\t{count}")
+        for r in results:
+            if r['status'] == "failed":
+                print(f"\t{r['name']}\t(code {r['code']})")
+
+        if self._missing:
+            print(f"Fetcher:\tmissing (no repo):\t{len(self._missing)}")
+            for username in self._missing:
+                print(f"\t{username}")
+
+        throttled = [r for r in results if r.get('throttled')]
+        if throttled:
+            print(f"Fetcher:\tthrottled (over {self._max_size} KB):\t" +
+                  f"{len(throttled)}")
+            for r in throttled:
+                print(f"\t{r['name']}\t({r['size']} KB, {r['throttled']})")
+
+    def _oversize(self, repo):
+        """
+        Return the action to take on a repo over the size limit, or None if
+        it's within the limit. Only repos that are actually over the limit
+        are throttled; `size` is GitHub(R)'s estimate, in KB.
+        """
+        if not self._max_size or repo.get('size', 0) <= self._max_size:
+            return None
+        action = self._oversize_action
+        # A tarball is already filtered to sources; there's nothing cheaper
+        # to switch it to.
+        if self._strategy == "tarball" and action in ("shallow", "sparse"):
+            action = "flag"
+        # Deadline snapshots need history, which a shallow clone doesn't
+        # have; sparse still cuts the download to the graded files.
+        if action == "shallow" and self._deadlines:
+            action = "sparse"
+        return action
+
+    def _schedule(self, records, matched):
+        """
+        Discover the org's repos and fetch every match on the worker pool.
+
+        :param records: The manifest records from the last fetch.
+        :param matched: Filled in with each matching repo's listing, by name.
+        :return: A tuple of the fetch results and whether discovery finished.
+        """
+        futures = []
+        deferred = []
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            def submit(repo, action=None):
+                strategy = action if action in ("shallow", "sparse") else None
+                prev = records.get(repo['name'], {})
+                future = pool.submit(self._fetch_repo, repo, prev, strategy)
+                futures.append((future, repo, action))
+
+            def schedule(repos):
+                for repo in repos:
+                    if not self._match(repo, cutoff=not self._roster):
+                        continue
+                    if self._clone:
+                        matched[repo['name']] = repo
+                        action = self._oversize(repo)
+                        if action:
+                            print(f"Fetcher:\toversize:\t{repo['name']}\t" +
+                                  f"({repo['size']} KB):\t{action}")
+                        if action == "defer":
+                            deferred.append(repo)
+                        else:
+                            submit(repo, action)
                     else:
                         # xxx log
-                        print(f'Fetcher:\tfetch:\t{repo['name']}')
+                        print(f'Fetcher:\tfetch:\t{repo["name"]}')
+
+            complete = True
+            try:
+                if not self._discover(on_page=schedule):
+                    print(f"no json response")
+            except (RuntimeError, requests.RequestException) as e:
+                # Don't pass off a partial listing as the whole org: finish
+                # and record what was scheduled, but flag the run.
+                print(f"Fetcher:\tERROR:\tincomplete listing:\t{e}")
+                complete = False
+
+            # Oversize repos go to the back of the queue, so they can't hold
+            # up the rest of the section.
+            for repo in deferred:
+                submit(repo, "defer")
+
+            results = []
+            for future, repo, action in futures:
+                result = future.result()
+                if action:
+                    result['throttled'] = action
+                    result['size'] = repo.get('size')
+                results.append(result)
+            return results, complete
+
+    def fetch(self):
+        """
+        List the org and clone every matching repo. In incremental mode,
+        existing clones are updated instead, and only if they changed.
+
+        Clones are scheduled on a bounded pool as soon as each listing page
+        arrives, so cloning overlaps with listing.
+
+        :return: A summary dict with `results` (one status record per repo),
+                 `failed` (the names of repos that failed to fetch),
+                 `throttled` (the names of repos over the size limit),
+                 `missing` (roster usernames with no repo),
+                 `complete` (False if the listing failed part way) and
+                 `snapshots` (the deadline snapshot records).
+        """
+        # Clearing would defeat an incremental fetch.
+        if self._config['fetch']['clear'] and not self._incremental:
+            # Snapshots are worktrees of the clones: clear them too.
+            snapshots = "".join(f"{self._snapshot_path(deadline)} "
+                                for deadline in self._deadlines)
+            stdout, stderr, code = self._shell.cmd(
+                    f"rm -rf {snapshots}{self._path} && " +
+                    f"mkdir {self._path}"
+            )
+
+        manifest = Manifest(self._path)
+        records = manifest.load()
+        matched = {}
+
+        if self._clone:
+            self._start_ssh()
+        try:
+            if self._clone and self._reference:
+                self._prepare_reference()
+            results, complete = self._schedule(records, matched)
+        finally:
+            self._stop_ssh()
+
+        results.sort(key=lambda r: r['name'])
+        if self._clone:
+            self._print_summary(results)
+
+            # Record what we now have on disk, for Reporter2 and the next
+            # incremental fetch.
+            for r in results:
+                records[r['name']] = self._record(
+                    matched[r['name']], r, records.get(r['name'], {})
+                )
+            # Roster students without a repo: no submission.
+            for username in self._missing:
+                name = f"{self._fmilestone}-{self._config['glob']}-{username}"
+                records.setdefault(name, {
+                    'name': name,
+                    'username': username,
+                    'path': f"{self._path}/{name}",
+                    'head': None,
+                    'pushed_at': None,
+                    'status': "missing",
+                    'throttled': None,
+                })
+            manifest.save(records)
+
+            if self._reference:
+                self._absorb_reference(results)
+
+        snapshots = {}
+        if self._clone and self._deadlines:
+            snapshots = self._snapshot(records)
+
+        return {
+            'results': results,
+            'failed': [r['name'] for r in results if r['status'] == "failed"],
+            'throttled': [r['name'] for r in results if r.get('throttled')],
+            'missing': list(self._missing),
+            'complete': complete,
+            'snapshots': snapshots,
+        }
+
+    def fetch_one(self, name):
+        """
+        Fetch a single repo by name, e.g. after a push to it, without
+        discovering the rest of the org, and update its manifest record. An
+        existing clone is updated in place.
+
+        :return: The repo's fetch result, or None if the repo doesn't exist or
+                 isn't one of the milestone's.
+        """
+        url = f"{self._api}/repos/{self._org}/{name}"
+        repo = self._get(url, {}, f"repo {name}", missing_ok=True)[0]
+        if repo is None or not self._match(repo):
+            print(f"Fetcher:\tfetch_one:\tnot a milestone repo:\t{name}")
+            return None
+        if not self._clone:
+            print(f'Fetcher:\tfetch:\t{repo["name"]}')
+            return None
+
+        manifest = Manifest(self._path)
+        records = manifest.load()
+        prev = records.get(name, {})
+
+        action = self._oversize(repo)
+        strategy = action if action in ("shallow", "sparse") else None
 
-            if 'Link' not in response.headers:
-                break
+        # A push always means new commits: update rather than re-clone, and
+        # don't let a stale `pushed_at` skip it as unchanged.
+        result = self._fetch_repo(repo, dict(prev, pushed_at=None), strategy,
+                                  update=True)
 
-            page += 1
+        records[name] = self._record(repo, result, prev)
+        manifest.save(records)
+        print(f"Fetcher:\tfetch_one:\t{name}:\t{result['status']}")
+        return result
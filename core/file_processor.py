@@ -1,5 +1,282 @@
+from tools import util
+
 import chardet
 import os
+import io
+import re
+import json
+import mmap
+import bisect
+import codecs
+import hashlib
+import threading
+
+
+# Bytes of a file that isn't UTF-8 that go to `chardet`; detection on a
+# prefix is about as accurate as on the whole file, at a fraction of the cost.
+_SAMPLE = 64 * 1024
+
+
+# Resolves the encoding of the (student) files FileProcessor opens.
+#
+# Strict UTF-8 (which covers ASCII) is tried first, as nearly every source
+# file is; only files that fail it are run through `chardet`, on a bounded
+# prefix. Results are cached in memory by path, size and mtime, so the checks
+# that reopen the same file don't resolve it again. With a cache file,
+# detected (non-UTF-8) encodings are also persisted by content hash, so they
+# survive re-clones and later runs.
+class EncodingResolver:
+    def __init__(self, cache=None, sample=_SAMPLE):
+        """
+        :param cache: JSON file to persist detected encodings in, or None.
+        :param sample: Most bytes to run detection on.
+        """
+        self._cache = cache
+        self._sample = sample
+        self._stats = {}
+        self._hashes = self._load()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not self._cache:
+            return {}
+        try:
+            with open(self._cache, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self):
+        if not self._cache:
+            return
+        util.write_atomic(self._cache, json.dumps(self._hashes))
+
+    def _detect(self, data):
+        """Detect the encoding of a file that isn't UTF-8."""
+        digest = hashlib.sha1(data).hexdigest()
+        with self._lock:
+            if digest in self._hashes:
+                return self._hashes[digest]
+        encoding = (chardet.detect(bytes(data[:self._sample]))['encoding'] or
+                    "utf-8")
+        with self._lock:
+            self._hashes[digest] = encoding
+            self._save()
+        return encoding
+
+    def _key(self, path):
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    def sniff(self, path, buf):
+        """
+        Return the encoding of a file known not to be plain UTF-8, from a
+        buffer of its contents (e.g. a mapping), without decoding it whole.
+        """
+        key = self._key(path)
+        encoding = self._stats.get(key)
+        if encoding is None:
+            if buf[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8:
+                encoding = "utf-8-sig"
+            else:
+                encoding = self._detect(buf)
+            self._stats[key] = encoding
+        return encoding
+
+    def decode(self, path, data):
+        """
+        Decode a file's contents, resolving its encoding.
+
+        :return: A tuple of the text (unknown bytes replaced) and encoding.
+        """
+        key = self._key(path)
+        encoding = self._stats.get(key)
+
+        if encoding is None:
+            if data.startswith(codecs.BOM_UTF8):
+                encoding = "utf-8-sig"
+            else:
+                try:
+                    text = data.decode("utf-8")
+                    self._stats[key] = "utf-8"
+                    return text, "utf-8"
+                except UnicodeDecodeError:
+                    encoding = self._detect(data)
+            self._stats[key] = encoding
+
+        return data.decode(encoding, errors='replace'), encoding
+
+    def resolve(self, path):
+        """Return a file's encoding."""
+        with open(path, 'rb') as file:
+            return self.decode(path, file.read())[1]
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def resolver():
+    """
+    Return the process's encoding resolver, persisted to `ENCODING_CACHE` if
+    that's set.
+    """
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = EncodingResolver(os.getenv('ENCODING_CACHE'))
+        return _resolver
+
+
+# Byte order marks of encodings that aren't ASCII-compatible, longest first
+# (a UTF-32 LE BOM starts with UTF-16 LE's).
+_WIDE_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def _ascii_compatible(encoding):
+    """Check if ASCII text is encoded as itself in `encoding`."""
+    try:
+        return "ASCII".encode(encoding) == b"ASCII"
+    except LookupError:
+        return True
+
+
+# A read-only, memory-mapped view of a file, for checks that only search it.
+#
+# Nothing is read or decoded up front: substring and (bytes) regex searches
+# run over the mapping directly, and only the lines that end up in a report
+# are decoded. Needles given as `str` are matched as UTF-8, which is exact for
+# the ASCII identifiers the checks look for in any ASCII-compatible encoding.
+# Files in encodings that aren't (UTF-16 and UTF-32, found by their BOM or
+# by `EncodingResolver` when the file has NUL bytes) are decoded whole
+# instead, and searched, with `str` offsets and matches, as text.
+class MappedFile:
+    def __init__(self, file_path):
+        self.name = file_path
+        self._map = None
+        self._lines = None
+        self._encoding = None
+        self._decoded = None
+        with open(file_path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            # Empty files can't be mapped.
+            if size:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buf = memoryview(self._map if self._map is not None else b"")
+
+        encoding = self._wide()
+        if encoding:
+            self._encoding = encoding
+            self._decoded = self.buf.tobytes().decode(encoding,
+                                                      errors='replace')
+
+    def _wide(self):
+        """Return the file's encoding if it isn't ASCII-compatible, or None."""
+        if self._map is None:
+            return None
+        head = self._map[:4]
+        for bom, encoding in _WIDE_BOMS:
+            if head.startswith(bom):
+                return encoding
+        # Text in an ASCII-compatible encoding has no NUL bytes.
+        if self._map.find(b"\x00", 0, _SAMPLE) == -1:
+            return None
+        encoding = resolver().sniff(self.name, self.buf)
+        return None if _ascii_compatible(encoding) else encoding
+
+    def __len__(self):
+        return len(self._target())
+
+    def __contains__(self, sub):
+        return self.find(sub) != -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.buf.release()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _needle(self, sub):
+        """Convert a needle to the type of the searched target."""
+        if self._decoded is not None:
+            return sub.decode() if isinstance(sub, bytes) else sub
+        return sub.encode() if isinstance(sub, str) else sub
+
+    def _target(self):
+        if self._decoded is not None:
+            return self._decoded
+        return self._map if self._map is not None else b""
+
+    def find(self, sub, start=0):
+        """Return the offset of the first `sub` from `start`, or -1."""
+        return self._target().find(self._needle(sub), start)
+
+    def finditer(self, pattern, flags=0):
+        """Iterate over the matches of a bytes regex (or `str` pattern)."""
+        if isinstance(pattern, re.Pattern):
+            pattern, flags = pattern.pattern, pattern.flags
+        pattern = re.compile(self._needle(pattern), flags)
+        return pattern.finditer(self._target())
+
+    def search(self, pattern, flags=0):
+        """
+        Return the first match of a bytes regex, or None. Like `finditer`'s,
+        its groups can only be read while the file is open.
+        """
+        return next(self.finditer(pattern, flags), None)
+
+    def _starts(self):
+        """Offsets of the start of every line, indexed on first use."""
+        if self._lines is None:
+            target = self._target()
+            newline = self._needle("\n")
+            starts = [0]
+            pos = target.find(newline)
+            while pos != -1:
+                starts.append(pos + 1)
+                pos = target.find(newline, pos + 1)
+            self._lines = starts
+        return self._lines
+
+    def line(self, offset):
+        """Return the (0-based) index of the line `offset` falls on."""
+        return bisect.bisect_right(self._starts(), offset) - 1
+
+    def span(self, idx):
+        """Return the `[start, end)` offsets of line `idx`, newline included."""
+        starts = self._starts()
+        end = starts[idx + 1] if idx + 1 < len(starts) else len(self)
+        return starts[idx], end
+
+    def text(self, start=0, end=None):
+        """Decode `[start, end)` of the file, and only that."""
+        if self._decoded is not None:
+            return self._decoded[start:end]
+        data = self.buf[start:end].tobytes()
+        if start == 0:
+            data = data.removeprefix(codecs.BOM_UTF8)
+        try:
+            return data.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+        if self._encoding is None:
+            self._encoding = resolver().sniff(self.name, self.buf)
+        return data.decode(self._encoding, errors='replace')
+
+    def line_text(self, idx):
+        """Decode line `idx`, without its line ending."""
+        return self.text(*self.span(idx)).rstrip("\r\n")
 
 
 # May take one file, or multiple files, or nested lists of files. Handles the
@@ -11,7 +288,8 @@ class FileProcessor:
         Initialize the FileProcessor with files and the operation (op) to apply on each file.
         
         :param files: Can be a single file, a list of files, or nested lists of files.
-        :param op: The operation to open the file handle as (e.g., `"r"`, `"w"`, etc.).
+        :param op: The operation to open the file handle as (e.g., `"r"`, `"w"`, etc.),
+                   or `"mmap"` for a read-only `MappedFile` to search.
         """
         # Normalize files to a list, even if a single file is passed.
         self.files = self._normalize_files(files)
@@ -81,9 +359,21 @@ class FileProcessor:
         :return: The file handle.
         """
         try:
+            if self.op == 'mmap':
+                return MappedFile(file_path)
+
             # For `UnicodeDecodeError: 'utf-8' codec can't decode byte 0x95`.
-            # Find encoding first. XXX This is very expensive!
-            encoding = chardet.detect(open(file_path, 'rb').read())['encoding']
+            # Find encoding first (see `EncodingResolver`).
+            if self.op in ('r', 'rt'):
+                # Reading: decode the one read into an in-memory handle,
+                # rather than reading the file again to open it.
+                with open(file_path, 'rb') as raw:
+                    text, encoding = resolver().decode(file_path, raw.read())
+                fh = io.StringIO(text, newline=None)
+                fh.name = file_path
+                return fh
+
+            encoding = resolver().resolve(file_path)
 
             # Then open the file with the client's op mode and a known encoding.
             # Replace unknown symbols.
@@ -179,45 +179,51 @@ class Grader:
             """
 
             try:
-                processor = FileProcessor(self.files["cpp"][clazz], 'r')
+                processor = FileProcessor(self.files["cpp"][clazz], 'mmap')
                 for fh, ftype in processor:
-                    lines = fh.readlines()
-                    #print(lines)
-                    for idx, line in enumerate(lines):
-                        #print(line)
-                        for fn, visited in self._func_cpp[clazz].items():
-                            if visited:
-                                continue
-                            if fn in line:
-                                func_strlst += f"FOUND: {fn} in {fh.name}\n"
-
-                                self._func_cpp[clazz][fn] = True
+                    # Find each function's first occurrence in the mapped
+                    # file, in file order, and only decode the lines that get
+                    # reported.
+                    hits = []
+                    for fn, visited in self._func_cpp[clazz].items():
+                        if visited:
+                            continue
+                        offset = fh.find(fn)
+                        if offset != -1:
+                            hits.append((fh.line(offset), fn))
+                    hits.sort(key=lambda hit: hit[0])
+
+                    for idx, fn in hits:
+                        line = fh.line_text(idx)
+                        prev = fh.line_text(idx - 1) if idx > 0 else ""
+                        func_strlst += f"FOUND: {fn} in {fh.name}\n"
+
+                        self._func_cpp[clazz][fn] = True
+
+                        inline = lambda l: (
+                            re.search(r"//", l) or
+                            (re.search(r"/\*", l) and re.search(r"\*/", l))
+                            # xxx could capture `/* .* */`
+                        )
 
-                                inline = lambda l: (
-                                    re.search(r"//", l) or
-                                    (re.search(r"/\*", l) and re.search(r"\*/", l))
-                                    # xxx could capture `/* .* */`
+                        if "*/" in prev or "//" in prev or inline(line):
+                            self._cpp_comments[clazz][fn] = True
+                            print(
+                                f"Grader: check_func: FOUND method header in "
+                                f"{fh.name} for {fn}."
+                            )
+                            if inline(line):
+                                print(
+                                    f"Grader: check_func: Method header line "
+                                    f"in {fh.name} at lines[{idx}]: "
+                                    f"{line.strip()}."
+                                )
+                            else:
+                                print(
+                                    f"Grader: check_func: Method header line "
+                                    f"in {fh.name} at lines[{idx - 1}: "
+                                    f"{prev.strip()}."
                                 )
-
-                                if ("*/" in lines[idx - 1] or "//" in lines[idx - 1] or
-                                    inline(line)):
-                                    self._cpp_comments[clazz][fn] = True
-                                    print(
-                                        f"Grader: check_func: FOUND method header in "
-                                        f"{fh.name} for {fn}."
-                                    )
-                                    if inline(line):
-                                        print(
-                                            f"Grader: check_func: Method header line "
-                                            f"in {fh.name} at lines[{idx}]: "
-                                            f"{line.strip()}."
-                                        )
-                                    else:
-                                        print(
-                                            f"Grader: check_func: Method header line "
-                                            f"in {fh.name} at lines[{idx - 1}: "
-                                            f"{lines[idx - 1].strip()}."
-                                        )
 
                     for e in self._func_cpp[clazz].items():
                         if not e[1]:
@@ -470,12 +476,11 @@ class Grader:
         # Flatten dictionary and just send all files to FileProcessor; it will
         # determine file type.
         files = list(self.files.values())
-        processor = FileProcessor(files, 'r')
-        for fh in processor:
+        processor = FileProcessor(files, 'mmap')
+        for fh, ftype in processor:
             found = False
-            buf = fh.read()
-            # Check if any list-related name exists in the buffer.
-            if any(name in buf for name in lst_names):
+            # Check if any list-related name exists in the (mapped) file.
+            if any(name in fh for name in lst_names):
                 found = True
                 break
 
@@ -510,11 +515,10 @@ class Grader:
         limit = 10000
         primes = list(primerange(2, limit + 1))
 
-        processor = FileProcessor(self.files["hpp"], 'r')
-        for fh in processor:
-            buf = fh.read()
-            # Check if any prime number is in the file.
-            if any(str(prime) in buf for prime in primes):
+        processor = FileProcessor(self.files["hpp"], 'mmap')
+        for fh, ftype in processor:
+            # Check if any prime number is in the (mapped) file.
+            if any(str(prime) in fh for prime in primes):
                 return pts
 
         return 0
@@ -0,0 +1,84 @@
+from tools import util
+
+import os
+import json
+import time
+import hashlib
+
+
+# On-disk cache of GitHub(R) API responses, keyed by URL and query parameters.
+# Entries keep the validators (`ETag`, `Last-Modified`) so the next request
+# can be made conditional; a `304 Not Modified` is then served from disk and
+# doesn't count against the rate limit.
+class HttpCache:
+    def __init__(self, path=".cache/http", ttl=86400, refresh=False):
+        """
+        :param path: Directory to keep cache entries in.
+        :param ttl: Seconds an entry stays valid for. Expired entries are
+                    ignored, forcing an unconditional request.
+        :param refresh: Ignore every existing entry (entries are still
+                        rewritten from fresh responses).
+        """
+        self._path = path
+        self._ttl = ttl
+        self._refresh = refresh
+
+    def _key(self, url, params):
+        params = "&".join(f"{k}={params[k]}" for k in sorted(params or {}))
+        return hashlib.sha1(f"{url}?{params}".encode()).hexdigest()
+
+    def _file(self, url, params):
+        return os.path.join(self._path, self._key(url, params) + ".json")
+
+    def get(self, url, params=None):
+        """Return the cached entry for a request, or None."""
+        if self._refresh:
+            return None
+        try:
+            with open(self._file(url, params), "r") as file:
+                entry = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if time.time() - entry.get('time', 0) > self._ttl:
+            return None
+        return entry
+
+    def headers(self, entry):
+        """Return the conditional request headers for a cached entry."""
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url, params, response, body):
+        """
+        Cache a successful response's validators and parsed body. Responses
+        without validators aren't cached, as they can't be revalidated.
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+
+        entry = {
+            'url': url,
+            'params': params,
+            'etag': etag,
+            'last_modified': last_modified,
+            'links': response.links,
+            'body': body,
+            'time': time.time(),
+        }
+        self._write(url, params, entry)
+
+    def touch(self, url, params, entry):
+        """Renew a revalidated entry's TTL."""
+        entry['time'] = time.time()
+        self._write(url, params, entry)
+
+    def _write(self, url, params, entry):
+        util.write_atomic(self._file(url, params), json.dumps(entry))
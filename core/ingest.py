@@ -0,0 +1,276 @@
+from core.manifest import Manifest
+
+import os
+import re
+import shutil
+import hashlib
+import tarfile
+import zipfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+
+# Loose files that are a submission on their own.
+_SOURCES = (".cpp",)
+
+# Archives, by the `tarfile` stream mode that reads them.
+_TARBALLS = {
+    ".tar": "r|",
+    ".tar.gz": "r|gz",
+    ".tgz": "r|gz",
+    ".tar.bz2": "r|bz2",
+    ".tar.xz": "r|xz",
+}
+
+# Copy buffer for extracting archive members.
+_CHUNK = 1 << 20
+
+
+def normalize(name):
+    """Replace whitespace in a file name with dashes."""
+    return re.sub(r"\s", "-", name)
+
+
+# Ingests emailed or LMS-downloaded submissions (zips, tarballs, loose `.cpp`
+# files) into the milestone's repo path, so they grade like fetched repos.
+#
+# Each submission gets its own directory, named after the submission with
+# whitespace replaced by dashes, and the milestone's `project_fhs` files
+# dropped in. Archives are extracted straight from the source file, one member
+# at a time, on a worker pool. Each submission is registered in the manifest,
+# with a digest of the submitted file as its `head`, so re-ingesting a
+# directory only re-extracts submissions that changed.
+class Ingester:
+    def __init__(self, milestone, config, path='', workers=4, late=None,
+                 fhs="project_fhs"):
+        """
+        :param milestone: The milestone, e.g. `milestone5`.
+        :param config: The milestone config.
+        :param path: Where to ingest to; the fetch path by default.
+        :param workers: Submissions to ingest concurrently.
+        :param late: "only" to ingest only `*LATE*` submissions, "skip" to
+                     leave them out, or None for all of them.
+        :param fhs: Directory of per-milestone files to drop into every
+                    submission, as `<fhs>/<milestone>-<prof>/`.
+        """
+        self._name = self.__class__.__name__
+        self._milestone = milestone
+        self._config = config
+        self._pmilestone = f"{milestone}-{config['prof']}"
+        self._path = path or f"repos/{self._pmilestone}"
+        self._workers = max(1, int(workers))
+        if late not in (None, "only", "skip"):
+            raise ValueError(
+                f"Unknown late filter: {late}. Expected one of: only, skip"
+            )
+        self._late = late
+        self._deploy = self._deploy_files(os.path.join(fhs, self._pmilestone))
+        print(f"{self._name}:\tpath:\t{self._path}")
+        print(f"{self._name}:\tproject files:\t{len(self._deploy)}")
+
+    def _deploy_files(self, dir):
+        """List the files to drop into every submission, minus `ignore-*`."""
+        files = []
+        for root, dirs, names in os.walk(dir):
+            dirs.sort()
+            for name in sorted(names):
+                if name.startswith("ignore-"):
+                    continue
+                file = os.path.join(root, name)
+                if os.path.isfile(file) and not os.path.islink(file):
+                    files.append(file)
+        return files
+
+    def _tar_ext(self, file):
+        """Return a tarball's extension, or None if it isn't one."""
+        lower = file.lower()
+        for ext in _TARBALLS:
+            if lower.endswith(ext):
+                return ext
+        return None
+
+    def _kind(self, file):
+        """
+        Classify a submission file.
+
+        :return: A tuple of its kind ("zip", "tar", "source" or None if it
+                 isn't a submission) and its directory name.
+        """
+        base = normalize(os.path.basename(file))
+        ext = self._tar_ext(base)
+        if ext:
+            return "tar", base[:-len(ext)]
+        stem, ext = os.path.splitext(base)
+        if ext.lower() == ".zip":
+            return "zip", stem
+        if not ext:
+            # Extensionless uploads are zips with the extension stripped.
+            return "zip", f"{stem}-noext"
+        if ext.lower() in _SOURCES:
+            return "source", stem
+        return None, stem
+
+    def _member_path(self, dir, member):
+        """
+        Map an archive member to its path under `dir`, normalizing its name,
+        or None if it would escape `dir`.
+        """
+        parts = [
+            normalize(p) for p in member.replace("\\", "/").split("/")
+            if p not in ("", ".")
+        ]
+        if not parts or ".." in parts or re.match(r"^[A-Za-z]:", parts[0]):
+            return None
+        return os.path.join(dir, *parts)
+
+    def _write(self, src, dest):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(dest, "wb") as out:
+            shutil.copyfileobj(src, out, _CHUNK)
+
+    def _extract_zip(self, file, dir):
+        with zipfile.ZipFile(file) as zip:
+            for info in zip.infolist():
+                if info.is_dir():
+                    continue
+                dest = self._member_path(dir, info.filename)
+                if dest is None:
+                    print(f"{self._name}:\tskipped member:\t{info.filename}")
+                    continue
+                with zip.open(info) as src:
+                    self._write(src, dest)
+
+    def _extract_tar(self, file, dir, mode):
+        # Stream mode: read front to back, never seeking or buffering the
+        # archive.
+        with tarfile.open(file, mode) as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                dest = self._member_path(dir, member.name)
+                if dest is None:
+                    print(f"{self._name}:\tskipped member:\t{member.name}")
+                    continue
+                self._write(tar.extractfile(member), dest)
+
+    def _digest(self, file):
+        with open(file, "rb") as src:
+            return hashlib.file_digest(src, "sha1").hexdigest()
+
+    def _ingest(self, file, kind, name, prev):
+        """
+        Ingest a single submission into `<path>/<name>`.
+
+        :param prev: The submission's manifest record from the last ingest,
+                     or {}.
+        :return: A status record with the submission's name, status, digest
+                 and duration in seconds.
+        """
+        start = time.monotonic()
+        dir = os.path.join(self._path, name)
+        head = self._digest(file)
+        result = {'name': name, 'status': "ingested", 'head': head}
+
+        if prev.get('head') == head and os.path.isdir(dir):
+            result['status'] = "unchanged"
+            print(f"{self._name}:\tunchanged:\t{name}")
+            result['duration'] = 0.0
+            return result
+
+        shutil.rmtree(dir, ignore_errors=True)
+        try:
+            if kind == "zip":
+                self._extract_zip(file, dir)
+            elif kind == "tar":
+                self._extract_tar(file, dir, _TARBALLS[self._tar_ext(file)])
+            else:
+                os.makedirs(dir)
+                shutil.copyfile(file, os.path.join(
+                    dir, normalize(os.path.basename(file))
+                ))
+            os.makedirs(dir, exist_ok=True)
+            for deploy in self._deploy:
+                shutil.copy(deploy, dir)
+        except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+            print(f"{self._name}:\tfailed:\t{name}:\t{e}")
+            result['status'] = "failed"
+            shutil.rmtree(dir, ignore_errors=True)
+
+        result['duration'] = time.monotonic() - start
+        print(f"{self._name}:\t{result['status']}:\t{name}\t" +
+              f"({result['duration']:.2f}s)")
+        return result
+
+    def _record(self, file, result, prev):
+        """Build a submission's manifest record from its ingest result."""
+        name = result['name']
+        ok = result['status'] != "failed"
+        mtime = datetime.fromtimestamp(os.path.getmtime(file), timezone.utc)
+        return {
+            'name': name,
+            'username': name,
+            'path': f"{self._path}/{name}",
+            'head': result['head'] if ok else prev.get('head'),
+            'pushed_at': mtime.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            'status': result['status'],
+            'throttled': None,
+        }
+
+    def ingest(self, src):
+        """
+        Ingest every submission in `src` (the directory's top level only).
+        `src` itself is left untouched.
+
+        :return: A summary dict with `results` (one status record per
+                 submission), `failed` and `skipped` (files that aren't
+                 submissions, or were filtered out).
+        """
+        manifest = Manifest(self._path)
+        records = manifest.load()
+        os.makedirs(self._path, exist_ok=True)
+
+        work = {}
+        skipped = []
+        for entry in sorted(os.listdir(src)):
+            file = os.path.join(src, entry)
+            if entry.startswith(".") or not os.path.isfile(file):
+                continue
+            late = "LATE" in normalize(entry)
+            if ((self._late == "only" and not late) or
+                (self._late == "skip" and late)):
+                skipped.append(entry)
+                continue
+            kind, name = self._kind(file)
+            if kind is None:
+                print(f"{self._name}:\tnot a submission:\t{entry}")
+                skipped.append(entry)
+                continue
+            if name in work:
+                print(f"{self._name}:\tduplicate submission:\t{name}:\t" +
+                      f"{entry}")
+                skipped.append(entry)
+                continue
+            work[name] = (file, kind)
+
+        results = []
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            futures = {
+                pool.submit(self._ingest, file, kind, name,
+                            records.get(name, {})): name
+                for name, (file, kind) in work.items()
+            }
+            for future in as_completed(futures):
+                results.append(future.result())
+        results.sort(key=lambda r: r['name'])
+
+        for r in results:
+            file = work[r['name']][0]
+            records[r['name']] = self._record(file, r,
+                                              records.get(r['name'], {}))
+        manifest.save(records)
+
+        failed = [r['name'] for r in results if r['status'] == "failed"]
+        print(f"{self._name}:\tingested:\t{len(results) - len(failed)}\t" +
+              f"failed:\t{len(failed)}\tskipped:\t{len(skipped)}")
+        return {'results': results, 'failed': failed, 'skipped': skipped}
@@ -0,0 +1,54 @@
+from tools import util
+
+import os
+import json
+
+
+# Per-milestone record of fetched repos, kept as JSON Lines at the root of the
+# milestone's repo path (a dotfile, so directory walks skip it). Fetcher
+# writes it; Reporter2 reads its work list from it.
+#
+# One record per repo:
+#   name        repo name
+#   username    GitHub(R) username, parsed from the repo name
+#   path        clone path
+#   head        HEAD sha, or None if never successfully fetched
+#   pushed_at   GitHub(R)'s `pushed_at` as of the last successful fetch
+#   status      status of the last fetch ("cloned", "updated", "unchanged",
+#               "failed", ...)
+#   throttled   action taken on an oversize repo ("flag", "shallow",
+#               "sparse", "defer"), or None
+class Manifest:
+    FILE = ".manifest.jsonl"
+
+    def __init__(self, root):
+        self._root = root
+        self._file = os.path.join(root, self.FILE)
+
+    def exists(self):
+        return os.path.isfile(self._file)
+
+    def load(self):
+        """Return the records as a dict keyed by repo name, in file order."""
+        records = {}
+        try:
+            with open(self._file, "r") as file:
+                for line in file:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"Manifest: skipping bad record: {line}")
+                        continue
+                    records[record['name']] = record
+        except FileNotFoundError:
+            pass
+        return records
+
+    def save(self, records):
+        """Write the records, sorted by repo name."""
+        util.write_atomic(self._file, "".join(
+            json.dumps(records[name]) + "\n" for name in sorted(records)
+        ))
@@ -6,18 +6,23 @@ from tools import util
 from core.shell import Shell
 from core.build import Build
 from core.grader import Grader
+from core.manifest import Manifest
 
 import os
 import re
 from dotenv import load_dotenv
 
 class Reporter2:
-    def __init__(self, milestone, config):
+    def __init__(self, milestone, config, deadline=None, repos=None):
         self._name = self.__class__.__name__
         self._dotenv = ".env"
         load_dotenv(self._dotenv)
         self._milestone = milestone
         self._config = config
+        # Report on a deadline snapshot (see `deadlines`) instead of HEAD.
+        self._deadline = deadline
+        # Only report on these repos (e.g. the one just pushed to).
+        self._only = repos
         self._rep = {}
         self._shell = Shell()
         self._set_config()
@@ -53,16 +58,36 @@ class Reporter2:
         prof = self._config['prof']
         print(f"Reporter: _set_config: professor: {prof}")
         self._repo_root = f"repos/{self._milestone}-{prof}/"
+        if self._deadline:
+            self._repo_root = f"repos/{self._milestone}-{prof}-{self._deadline}/"
         print(f"Reporter: _set_config: repository root: {self._repo_root}")
 
-        # Preprocess: Put our projects in a data structure to iterate.
-        # xxx could also be set up ahead of time by fetch.
+        # Preprocess: Put our projects in a data structure to iterate. Prefer
+        # the manifest written by fetch; fall back to listing the repo root
+        # for trees that weren't fetched (or were fetched before manifests).
         self.repos = []
+        self._manifest = {}
+        manifest = Manifest(self._repo_root)
+        if manifest.exists():
+            print("Reporter: _set_config: Reading repository manifest...")
+            self._manifest = manifest.load()
+            for name, record in self._manifest.items():
+                if self._only is not None and name not in self._only:
+                    continue
+                if not record.get('head'):
+                    print(f"{self._name}: INFO: skipping unfetched: '{name}'...")
+                    continue
+                print(f"Reporter: _set_config: Appended repository: {name}.")
+                self.repos.append(name)
+            return
+
         print("Reporter: _set_config: Building repository list...")
         for dir in os.listdir(self._repo_root):
             if dir.startswith("."):
                 print(f"{self._name}: INFO: skipping dotfile: '{dir}'...")
                 continue
+            if self._only is not None and dir not in self._only:
+                continue
 
             print(f"Reporter: _set_config: Appended repository: {dir}.")
             self.repos.append(dir)
@@ -72,12 +97,13 @@ class Reporter2:
 
         if os.getenv('TRIM_REPO', '').strip():
             username = repo
+        elif self._manifest.get(repo, {}).get('username'):
+            username = self._manifest[repo]['username']
         else:
-            glob = self._config['glob']
-            # xxx could prolly anchor `^`, but we know this pattern works.
-            reg = re.search(f"{self._fmilestone}-{glob}-(.*)$", repo)
-            if reg != None and reg[1] != None:
-                username = reg[1]
+            reg = util.repo_username(self._fmilestone, self._config['glob'],
+                                     repo)
+            if reg != None:
+                username = reg
 
         print(f"Reporter: _get_git_username: {username}.")
         return username
@@ -878,8 +904,13 @@ class Reporter2:
     # Generates a pretty formatted report.
     def report(self):
         for k, v in self._rep.items():
-            # xxx make sure reports exists.
-            path = f'repos/{self._milestone}/reports/{k}_report.txt'
+            # Each deadline's reports go in their own directory, so grading
+            # passes don't overwrite each other.
+            reports = f'repos/{self._milestone}/reports'
+            if self._deadline:
+                reports += f'-{self._deadline}'
+            os.makedirs(reports, exist_ok=True)
+            path = f'{reports}/{k}_report.txt'
             out = open(path, 'w')
 
             def print_list(lst, out, header, tabs=0):
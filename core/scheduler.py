@@ -0,0 +1,221 @@
+import time
+import random
+import threading
+import requests
+from email.utils import parsedate_to_datetime
+
+
+# Statuses worth retrying: server errors, and rate limiting (`403` is also
+# GitHub(R)'s status for primary and secondary rate limits).
+_RETRY_STATUSES = (403, 429, 500, 502, 503, 504)
+
+# Least wait after a secondary rate limit without a `Retry-After`, as
+# GitHub(R) documents it.
+_SECONDARY_WAIT = 60.0
+
+
+# The rate limit budget of one API resource (e.g. "core" or "search").
+class _Budget:
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.remaining = None
+        self.reset = None
+
+
+# Gates GitHub(R) API requests on the rate limit the API reports back.
+#
+# Tracks `X-RateLimit-Remaining` and `X-RateLimit-Reset` from every response,
+# per `X-RateLimit-Resource` (search has its own, much smaller budget than
+# core requests), and adapts how many requests to each resource may be in
+# flight: concurrency grows while the budget is plentiful and shrinks as it
+# runs low. When a budget runs out, requests against it sleep until its reset
+# time. Server errors and secondary rate limits are retried with jittered
+# exponential backoff, honouring `Retry-After`.
+class RequestScheduler:
+    def __init__(self, concurrency=8, retries=5, backoff=1.0, reserve=50,
+                 sleep=time.sleep):
+        """
+        :param concurrency: Most requests allowed in flight at once, per
+                            resource.
+        :param retries: Retries per request before giving up.
+        :param backoff: Base backoff, in seconds.
+        :param reserve: Remaining budget below which requests run one at a
+                        time.
+        :param sleep: Sleep function (injectable for testing).
+        """
+        self._max = max(1, concurrency)
+        self._retries = retries
+        self._backoff = backoff
+        self._reserve = reserve
+        self._sleep = sleep
+
+        self._budgets = {}
+        self._cond = threading.Condition()
+
+    def _budget(self, resource):
+        """Return a resource's budget. Call with `_cond` held."""
+        if resource not in self._budgets:
+            self._budgets[resource] = _Budget(self._max)
+        return self._budgets[resource]
+
+    @property
+    def limit(self):
+        return self.limit_of("core")
+
+    def limit_of(self, resource):
+        with self._cond:
+            return self._budget(resource).limit
+
+    def _acquire(self, resource):
+        with self._cond:
+            budget = self._budget(resource)
+            while budget.active >= budget.limit:
+                self._cond.wait()
+            budget.active += 1
+
+    def _release(self, resource):
+        with self._cond:
+            self._budget(resource).active -= 1
+            self._cond.notify_all()
+
+    def _wait_for_budget(self, resource):
+        """Sleep until the reset time if a resource's budget is exhausted."""
+        with self._cond:
+            budget = self._budget(resource)
+            if budget.remaining is None or budget.remaining > 0:
+                return
+            delay = (budget.reset or 0) - time.time()
+        if delay > 0:
+            print(f"RequestScheduler: {resource} rate limit exhausted: "
+                  f"sleeping {delay:.0f}s until reset")
+            self._sleep(delay + 1)
+        with self._cond:
+            # Assume the budget is back; the next response tells us for sure.
+            budget.remaining = None
+
+    def _update(self, response, resource):
+        """Track the budget reported by a response and adapt concurrency."""
+        resource = response.headers.get('X-RateLimit-Resource', resource)
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        with self._cond:
+            budget = self._budget(resource)
+            if reset is not None:
+                budget.reset = int(reset)
+            if remaining is None:
+                return
+            budget.remaining = int(remaining)
+
+            if budget.remaining <= self._reserve:
+                limit = 1
+            elif budget.remaining <= self._reserve + 10 * budget.limit:
+                limit = max(1, budget.limit // 2)
+            else:
+                limit = min(self._max, budget.limit + 1)
+
+            if limit != budget.limit:
+                print(f"RequestScheduler: {resource} remaining "
+                      f"{budget.remaining}: concurrency {budget.limit} -> "
+                      f"{limit}")
+                budget.limit = limit
+                self._cond.notify_all()
+
+    def _retry_after(self, response):
+        """
+        Parse a `Retry-After` header, in seconds or as an HTTP date, into
+        seconds to wait, or None if there isn't a usable one.
+        """
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() -
+                            time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def _secondary(self, response):
+        """Check if a response is a secondary (abuse) rate limit."""
+        if response.status_code not in (403, 429):
+            return False
+        text = response.text
+        return isinstance(text, str) and "secondary rate limit" in text.lower()
+
+    def _delay(self, response, attempt):
+        """
+        Return how long to wait before retrying a response, or None if it
+        shouldn't be retried.
+        """
+        if response.status_code not in _RETRY_STATUSES:
+            return None
+
+        retry_after = self._retry_after(response)
+        if self._secondary(response):
+            # Secondary limits come with budget left, and retrying early only
+            # extends them.
+            wait = max(retry_after or 0.0, _SECONDARY_WAIT)
+            return wait * random.uniform(1.0, 1.5)
+        if retry_after is not None:
+            return retry_after
+
+        if response.status_code in (403, 429):
+            # Primary limit: retry straight away, as the next attempt sleeps
+            # until the reset anyway. A 403 with budget left isn't rate
+            # limiting (e.g. a bad token), so don't retry it.
+            if response.headers.get('X-RateLimit-Remaining') == "0":
+                return 0.0
+            if response.status_code == 403:
+                return None
+
+        return self._jitter(attempt)
+
+    def _jitter(self, attempt):
+        return self._backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def request(self, send, resource="core"):
+        """
+        Send a request under the scheduler, retrying as needed.
+
+        :param send: A callable that sends the request and returns the
+                     response.
+        :param resource: The rate limit resource the request counts against,
+                         e.g. "core" or "search".
+        :return: The final response. Raises the last connection error if
+                 every attempt failed to connect.
+        """
+        for attempt in range(self._retries + 1):
+            self._wait_for_budget(resource)
+
+            self._acquire(resource)
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self._retries:
+                    raise
+                print(f"RequestScheduler: {e}: retrying")
+                response = None
+            finally:
+                self._release(resource)
+
+            if response is None:
+                self._sleep(self._jitter(attempt))
+                continue
+
+            self._update(response, resource)
+            delay = self._delay(response, attempt)
+            if delay is None or attempt == self._retries:
+                return response
+
+            print(f"RequestScheduler: status {response.status_code}: "
+                  f"retrying in {delay:.1f}s")
+            # Give a discarded (e.g. streamed) response's connection back to
+            # the pool.
+            response.close()
+            if delay > 0:
+                self._sleep(delay)
+        return response
@@ -1,15 +1,407 @@
 from tools import util
+from core.capabilities import capabilities
 
 import os
+import re
+import json
+import math
+import asyncio
+import shlex
+import signal
+import select
 import subprocess
 import shutil
 import sys
+import time
+import tempfile
+import threading
+import uuid
+import weakref
+
+# Not on Windows; traces there have no CPU time.
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Shell backends: "subprocess" spawns a shell per command; "persistent" runs
+# commands in one long-lived bash per thread (not on Windows).
+_BACKENDS = ("subprocess", "persistent")
+
+# Exit code for a command that timed out, as `timeout(1)` reports it.
+TIMEOUT_CODE = 124
+
+
+def _kill(state):
+    """Kill a coprocess's process group and remove its scratch directory."""
+    proc = state.get('proc')
+    if proc is not None:
+        if proc.poll() is None:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            proc.wait()
+        proc.stdin.close()
+        proc.stdout.close()
+    if state.get('dir'):
+        shutil.rmtree(state['dir'], ignore_errors=True)
+    state.clear()
+
+
+# A long-lived bash that runs commands one at a time, so a command costs a
+# fork of a small shell instead of a fork and exec of `/bin/sh` from Python.
+#
+# Each command is `eval`ed in a subshell, so `cd`, `exit`, variables and even
+# syntax errors can't leak into the next command. Its stdout and stderr go to
+# scratch files and only a marker line with a random token and the exit code
+# comes back over the pipe, so output can never be mistaken for the end of a
+# command. Changes to Python's environment and working directory are replayed
+# before each command. A command that times out takes the shell down with it
+# (its whole process group); a dead shell is restarted on the next command.
+class Coprocess:
+    def __init__(self, bash="bash"):
+        self._name = self.__class__.__name__
+        self._bash = bash
+        self._env = {}
+        self._token = None
+        # What `_kill()` needs, kept apart from `self` so the shell is also
+        # killed when a worker thread exits and drops its coprocess.
+        self._state = {}
+        weakref.finalize(self, _kill, self._state)
+
+    def alive(self):
+        proc = self._state.get('proc')
+        return proc is not None and proc.poll() is None
+
+    def start(self):
+        self.close()
+        self._state['dir'] = tempfile.mkdtemp(prefix="gc-sh-")
+        self._token = f"__gc_{uuid.uuid4().hex}__"
+        self._env = dict(os.environ)
+        self._state['proc'] = subprocess.Popen(
+            [*shlex.split(self._bash), "--noprofile", "--norc"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, bufsize=0, start_new_session=True
+        )
+
+    def close(self):
+        _kill(self._state)
+
+    def _sync_env(self):
+        """Return the `export`s and `unset`s that bring the shell up to date."""
+        env = dict(os.environ)
+        lines = []
+        for k in self._env.keys() - env.keys():
+            if re.fullmatch(r"[A-Za-z_]\w*", k):
+                lines.append(f"unset {k}")
+        for k, v in env.items():
+            if self._env.get(k) != v and re.fullmatch(r"[A-Za-z_]\w*", k):
+                lines.append(f"export {k}={shlex.quote(v)}")
+        self._env = env
+        return lines
+
+    def _read(self, file):
+        try:
+            with open(file, "r", encoding="utf-8", errors="replace") as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+
+    def _wait(self, fd, timeout):
+        """
+        Read the pipe up to the command's marker.
+
+        :return: The exit code, None on timeout, or False if the shell died.
+        """
+        buf = b""
+        marker = re.compile(rb"%s (\d+)\n" % self._token.encode())
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = None
+            if deadline is not None:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    return None
+            ready, _, _ = select.select([fd], [], [], wait)
+            if not ready:
+                continue
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                return False
+            buf += chunk
+            match = marker.search(buf)
+            if match:
+                return int(match[1])
+
+    def run(self, cmd, timeout=None):
+        """
+        Run a command in the shell.
+
+        :param timeout: Seconds to wait for the command, or None for no limit.
+        :return: A tuple of its stdout, stderr and exit code.
+        """
+        if not self.alive():
+            if self._state:
+                print(f"{self._name}: shell died: restarting")
+            self.start()
+
+        dir = self._state['dir']
+        out = os.path.join(dir, "out")
+        err = os.path.join(dir, "err")
+        script = "\n".join(self._sync_env() + [
+            f"cd -- {shlex.quote(os.getcwd())} 2>/dev/null",
+            f"( eval {shlex.quote(cmd)} ) </dev/null >{out} 2>{err}",
+            f"printf '%s %d\\n' {self._token} $?",
+        ]) + "\n"
+
+        proc = self._state['proc']
+        try:
+            proc.stdin.write(script.encode())
+            code = self._wait(proc.stdout.fileno(), timeout)
+        except (BrokenPipeError, OSError):
+            code = False
+
+        stdout, stderr = self._read(out), self._read(err)
+        if code is None:
+            self.close()
+            return stdout, stderr + f"Shell: timed out after {timeout}s\n", \
+                TIMEOUT_CODE
+        if code is False:
+            self.close()
+            return stdout, stderr + "Shell: shell died\n", -1
+        return stdout, stderr, code
+
+
+# One coprocess per thread, shared by every Shell in that thread.
+_local = threading.local()
+
+
+def _coprocess(bash):
+    co = getattr(_local, 'coprocess', None)
+    if co is None:
+        co = Coprocess(bash)
+        _local.coprocess = co
+    return co
+
+
+# Most `Shell.acmd()` commands allowed to run at once, across every Shell.
+_async_limit = int(os.getenv('SHELL_JOBS', 0)) or os.cpu_count() or 4
+
+# One semaphore per event loop, as a semaphore is bound to the loop it's first
+# used on.
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def set_async_limit(n):
+    """Set how many `Shell.acmd()` commands may run at once."""
+    global _async_limit
+    _async_limit = max(1, int(n))
+    _semaphores.clear()
+
+
+def _semaphore():
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(_async_limit)
+    return _semaphores[loop]
+
+
+def _killpg(proc):
+    """Kill a (possibly asyncio) subprocess and everything it started."""
+    if proc.returncode is not None:
+        return
+    try:
+        if util.is_windows():
+            proc.kill()
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+# Builtins and housekeeping commands skipped over when naming a command's
+# family, so `cd build && cmake ..` is "cmake", not "cd".
+_PLUMBING = {
+    "cd", "echo", "printf", "true", "false", "rm", "mkdir", "cp", "mv", "test",
+    "[", "export", "set", "exec", "then", "do", "if", "for", "while",
+}
+
+
+def family(cmd):
+    """
+    Name the program a command is for: the first command in the chain that
+    isn't a builtin or housekeeping, e.g. "git", "cmake" or "find-cpp.sh".
+    """
+    first = None
+    for segment in re.split(r"&&|\|\||[;|&\n]|\$\(|`", cmd):
+        try:
+            words = shlex.split(segment)
+        except ValueError:
+            words = segment.split()
+        # Skip leading `VAR=value` assignments.
+        words = [w for w in words if w and w != "(" and w != ")"]
+        while words and re.fullmatch(r"[A-Za-z_]\w*=.*", words[0]):
+            words.pop(0)
+        if not words:
+            continue
+        name = os.path.basename(words[0].rstrip(")"))
+        first = first or name
+        if name not in _PLUMBING:
+            return name
+    return first or ""
+
+
+def _cpu():
+    """CPU time used by reaped child processes so far, in seconds."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _caller():
+    """Name the component running a command: the class of the first method
+    outside this module on the stack, else the function's name."""
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return None
+    owner = frame.f_locals.get('self')
+    if owner is not None:
+        return owner.__class__.__name__
+    return frame.f_code.co_name
+
+
+# Opt-in record of every shell command, as JSON Lines: the command, its family
+# and caller, wall and CPU time, bytes of output and exit code. Enabled by the
+# `SHELL_TRACE` environment variable (the file to append to) or
+# `set_trace()`; summarized by `python -m tools.trace`.
+#
+# CPU time is the children's rusage, which the process shares across
+# threads, so it's approximate when commands run concurrently. Commands run by
+# the persistent backend aren't reaped by this process, so have none.
+class ShellTracer:
+    def __init__(self, path):
+        self._path = path
+        dir = os.path.dirname(path)
+        if dir:
+            os.makedirs(dir, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def begin(self):
+        return time.monotonic(), _cpu()
+
+    def end(self, start, cmd, caller, backend, result):
+        wall = time.monotonic() - start[0]
+        cpu = _cpu()
+        stdout, stderr, code = result
+        record = {
+            'time': time.time(),
+            'cmd': cmd if isinstance(cmd, str) else shlex.join(cmd),
+            'family': family(cmd if isinstance(cmd, str) else cmd[0]),
+            'caller': caller,
+            'backend': backend,
+            'wall': round(wall, 6),
+            'cpu': None if cpu is None or start[1] is None or
+                   backend == "persistent" else round(cpu - start[1], 6),
+            'stdout_bytes': len(stdout.encode('utf-8', errors='replace')),
+            'stderr_bytes': len(stderr.encode('utf-8', errors='replace')),
+            'code': code,
+        }
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_tracer = None
+if os.getenv('SHELL_TRACE'):
+    _tracer = ShellTracer(os.getenv('SHELL_TRACE'))
+
+
+def set_trace(path):
+    """Trace every shell command to `path`, or stop tracing if None."""
+    global _tracer
+    if _tracer:
+        _tracer.close()
+    _tracer = ShellTracer(path) if path else None
+
+
+def load_trace(path):
+    """Read a trace's records, skipping lines that don't parse."""
+    records = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records
+
+
+def _percentile(values, p):
+    """Nearest-rank percentile of sorted `values`."""
+    return values[max(0, math.ceil(p * len(values)) - 1)]
+
+
+def summarize(records, by="family"):
+    """
+    Group trace records by a field and total up their wall time.
+
+    :return: One dict per group (`key`, `count`, `total`, `p50`, `p95`,
+             `cpu`, `failed`), most total wall time first.
+    """
+    groups = {}
+    for r in records:
+        groups.setdefault(r.get(by) or "?", []).append(r)
+
+    rows = []
+    for key, group in groups.items():
+        walls = sorted(r['wall'] for r in group)
+        cpus = [r['cpu'] for r in group if r.get('cpu') is not None]
+        rows.append({
+            'key': key,
+            'count': len(group),
+            'total': sum(walls),
+            'p50': _percentile(walls, 0.50),
+            'p95': _percentile(walls, 0.95),
+            'cpu': sum(cpus) if cpus else None,
+            'failed': sum(1 for r in group if r.get('code') != 0),
+        })
+    rows.sort(key=lambda row: row['total'], reverse=True)
+    return rows
 
 
 class Shell:
-    def __init__(self):
+    def __init__(self, backend=None):
+        """
+        :param backend: "subprocess" or "persistent"; defaults to the
+                        `SHELL_BACKEND` environment variable, then
+                        "subprocess".
+        """
         self._os = os.name
         self._bash = self._get_bash_path()
+        backend = backend or os.getenv('SHELL_BACKEND') or "subprocess"
+        if backend not in _BACKENDS:
+            raise ValueError(
+                f"Unknown shell backend: {backend}. " +
+                f"Expected one of: {', '.join(_BACKENDS)}"
+            )
+        # No persistent bash on Windows; Git Bash is spawned per command.
+        if util.is_windows():
+            backend = "subprocess"
+        self._backend = backend
+        # Tools this host has, resolved once per process and shared by every
+        # Shell (and the components that own them).
+        self.caps = capabilities()
         self._check_dep()
 
     def _get_bash_path(self):
@@ -34,27 +426,130 @@ class Shell:
         Ensure required dependencies like `grep` are available.
         On Windows, Git Bash includes grep; ensure it works.
         """
-        try:
-            stdout, stderr, code = self.cmd("grep --version")
-            if code != 0:
-                raise RuntimeError(f"grep check failed with error: {stderr}")
-        except FileNotFoundError:
-            print("Error: `grep` command not found.")
-            sys.exit(1)
+        if not self.caps.has("grep"):
+            raise RuntimeError("grep check failed: `grep` not found or "
+                               "`grep --version` failed")
 
-    def cmd(self, cmd):
+    def cmd(self, cmd, timeout=None):
         """
         Run a shell command.
         On Windows, use Git Bash if specified; otherwise, run normally.
+
+        :param timeout: Seconds to let the command run, or None for no limit.
+                        A command that runs over is killed, and returns
+                        `TIMEOUT_CODE`.
         """
+        if _tracer is None:
+            return self._cmd(cmd, timeout)
+        start = _tracer.begin()
+        result = self._cmd(cmd, timeout)
+        _tracer.end(start, cmd, _caller(), self._backend, result)
+        return result
+
+    def _cmd(self, cmd, timeout):
+        if self._backend == "persistent":
+            return _coprocess(self._bash).run(cmd, timeout)
+
         if util.is_windows():
-            # Wrap the command for Git Bash compatibility.
-            # xxx why do we need to join here?
-            result = subprocess.run(f"{self._bash} -c \"{cmd}\"",
-                                    capture_output=True, text=True)
-        else:
+            try:
+                # Wrap the command for Git Bash compatibility.
+                # xxx why do we need to join here?
+                result = subprocess.run(f"{self._bash} -c \"{cmd}\"",
+                                        capture_output=True, text=True,
+                                        timeout=timeout)
+            except subprocess.TimeoutExpired as e:
+                stdout, stderr = e.stdout or "", e.stderr or ""
+                if isinstance(stdout, bytes):
+                    stdout = stdout.decode('utf-8', errors='replace')
+                if isinstance(stderr, bytes):
+                    stderr = stderr.decode('utf-8', errors='replace')
+                return stdout, stderr + f"Shell: timed out after {timeout}s\n", \
+                    TIMEOUT_CODE
+            return result.stdout, result.stderr, result.returncode
+
+        if timeout is None:
             result = subprocess.run(cmd, shell=True, capture_output=True,
                                     text=True, encoding='utf-8',
                                     errors='replace')
+            return result.stdout, result.stderr, result.returncode
+
+        # In its own process group, so a timeout kills everything the command
+        # started, not just `/bin/sh`. Only for commands with a timeout: a new
+        # session has no controlling terminal (e.g. for SSH prompts), and
+        # Ctrl-C doesn't reach it.
+        with subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, text=True,
+                              encoding='utf-8', errors='replace',
+                              start_new_session=True) as proc:
+            try:
+                stdout, stderr = proc.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                _killpg(proc)
+                stdout, stderr = proc.communicate()
+                return stdout, stderr + f"Shell: timed out after {timeout}s\n", \
+                    TIMEOUT_CODE
+            except BaseException:
+                # E.g. KeyboardInterrupt, which doesn't reach the group.
+                _killpg(proc)
+                raise
+        return stdout, stderr, proc.returncode
+
+    def _argv(self, cmd):
+        if util.is_windows():
+            return [self._bash, "-c", cmd]
+        return [*shlex.split(self._bash), "-c", cmd]
+
+    async def acmd(self, cmd, timeout=None):
+        """
+        Run a shell command without blocking the event loop.
+
+        Commands run through bash in their own process group, at most
+        `set_async_limit()` at once across the process. A command that times
+        out, or whose task is cancelled, is killed along with everything it
+        started.
+
+        :param timeout: Seconds to let the command run, or None for no limit.
+                        A command that runs over returns `TIMEOUT_CODE`.
+        :return: A tuple of its stdout, stderr and exit code, as `cmd()`.
+        """
+        if _tracer is None:
+            return await self._acmd(cmd, timeout)
+        caller = _caller()
+        start = _tracer.begin()
+        result = await self._acmd(cmd, timeout)
+        _tracer.end(start, cmd, caller, "async", result)
+        return result
+
+    async def _acmd(self, cmd, timeout):
+        async with _semaphore():
+            proc = await asyncio.create_subprocess_exec(
+                *self._argv(cmd), stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=not util.is_windows()
+            )
+
+            out, err = [], []
+            async def drain(stream, chunks):
+                while chunk := await stream.read(1 << 16):
+                    chunks.append(chunk)
+
+            timed_out = False
+            try:
+                await asyncio.wait_for(asyncio.gather(
+                    drain(proc.stdout, out), drain(proc.stderr, err),
+                    proc.wait()
+                ), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+            finally:
+                # On a timeout or cancellation; a no-op once it's exited.
+                _killpg(proc)
+                await asyncio.shield(proc.wait())
 
-        return result.stdout, result.stderr, result.returncode
+        stdout = b"".join(out).decode('utf-8', errors='replace')
+        stderr = b"".join(err).decode('utf-8', errors='replace')
+        if timed_out:
+            return stdout, stderr + f"Shell: timed out after {timeout}s\n", \
+                TIMEOUT_CODE
+        return stdout, stderr, proc.returncode
@@ -14,8 +14,12 @@ from core.build import Build
 from core.fetch import Fetcher
 from core.grader import Grader
 from core.reporter2 import Reporter2
+from core.bundle import Bundler
+from core.ingest import Ingester
+from core.webhook import PushListener
 
 import argparse
+import os
 import re
 
 # Grade HashTable.
@@ -54,6 +58,24 @@ def grade_hash_table():
     return score  # Return the final grade score
 
 
+# Fetch and report each repo as it's pushed to.
+def listen(milestone, port):
+    fetcher = Fetcher(milestone, config._config, incremental=True)
+
+    def regrade(name):
+        if fetcher.fetch_one(name) is None:
+            return
+        reporter = Reporter2(milestone, config._config, repos=[name])
+        reporter._report()
+        reporter.report()
+
+    # Fetcher has loaded `.env`.
+    listener = PushListener(regrade, os.getenv('WEBHOOK_SECRET'),
+                            org=config._config['org'], host="0.0.0.0",
+                            port=port)
+    listener.serve_forever()
+
+
 def main():
     parser = argparse.ArgumentParser(
             prog = "Grade Checker"
@@ -65,6 +87,32 @@ def main():
                         help="Grade fetched repos.")
     parser.add_argument("-r", "--report", action="store_true",
                         help="Grade and report fetched repos.")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Number of concurrent clones when fetching.")
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        default=None,
+                        help="Update existing clones instead of re-cloning.")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Ignore the cached org listing.")
+    parser.add_argument("--roster", default=None,
+                        help="CSV or JSON roster of usernames to fetch.")
+    parser.add_argument("-d", "--deadline", default=None,
+                        help="Report on a deadline snapshot, e.g. `initial`.")
+    parser.add_argument("--export", default=None, metavar="DIR",
+                        help="Export fetched repos as git bundles to DIR.")
+    parser.add_argument("--import", dest="import_", default=None,
+                        metavar="DIR",
+                        help="Import repos exported with --export from DIR.")
+    parser.add_argument("--ingest", default=None, metavar="DIR",
+                        help="Ingest zipped or loose-file submissions from "
+                             "DIR.")
+    parser.add_argument("--late", choices=["only", "skip"], default=None,
+                        help="Ingest only `*LATE*` submissions, or skip "
+                             "them.")
+    parser.add_argument("-l", "--listen", type=int, nargs="?", const=8080,
+                        default=None, metavar="PORT",
+                        help="Fetch and report each repo as it's pushed to, "
+                             "from GitHub(R) push webhooks.")
 
     args = parser.parse_args()
 
@@ -73,11 +121,26 @@ def main():
     milestone = reg[1]  # expected output: milestoneX
 
     config.merge(args.milestone)
+    path = f"repos/{milestone}-{config._config['prof']}"
+    jobs = args.jobs or config._config.get('fetch', {}).get('workers', 4)
+
+    if args.import_:
+        Bundler(path, workers=jobs).unpack(args.import_)
+
+    if args.ingest:
+        ingester = Ingester(milestone, config._config, workers=jobs,
+                            late=args.late)
+        ingester.ingest(args.ingest)
 
     if args.fetch:
-        fetcher = Fetcher(milestone, config._config)
+        fetcher = Fetcher(milestone, config._config, workers=args.jobs,
+                          incremental=args.incremental, refresh=args.refresh,
+                          roster=args.roster)
         fetcher.fetch()
 
+    if args.export:
+        Bundler(path, workers=jobs).pack(args.export)
+
     if args.grade:
         shell = Shell()
         grader = Grader(shell, milestone, config)
@@ -113,12 +176,16 @@ def main():
 
     if args.report:
         print("main: Entered Reporter.")
-        reporter = Reporter2(milestone, config._config)
+        reporter = Reporter2(milestone, config._config,
+                             deadline=args.deadline)
         reporter._report()
         reporter.report()
         # xxx we always build. keep track of what's already built to not build
         # again.
 
+    if args.listen is not None:
+        listen(milestone, args.listen)
+
 
 
         
@@ -0,0 +1,100 @@
+"""
+Benchmark Fetcher's listing and clone throughput against the offline GitHub(R)
+stand-in. Needs no network or PAT.
+
+    python -m tests.bench.fetch_bench
+    python -m tests.bench.fetch_bench --sizes 50 500 --latency 0.1 -j 16
+"""
+
+from core.fetch import Fetcher
+from tests.github_standin import GitHubStandIn, make_fixture_org
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from unittest.mock import patch
+
+
+_milestone = "milestone5"
+
+
+def _config(standin, path, workers, clone):
+    return {
+        "prof": "bench",
+        "org": standin.org,
+        "clone": clone,
+        "glob": "cachemanager-bst",
+        "files": [],
+        "fetch": {
+            "clear": False,
+            "cache": False,
+            "workers": workers,
+            "remote": standin.remote,
+        },
+    }
+
+
+def bench(root, n, latency, workers, clone):
+    """Time listing and fetching a fixture org of `n` repos."""
+    repos = make_fixture_org(root, "org", n)
+    path = os.path.join(root, "repos")
+
+    with GitHubStandIn("org", repos, latency=latency) as standin, \
+         patch.dict(os.environ, {"GITHUB_API": standin.url}), \
+         patch("builtins.print"):
+        cfg = _config(standin, path, workers, clone)
+
+        fetcher = Fetcher(_milestone, cfg, path=path)
+        start = time.monotonic()
+        listed = fetcher._list_repos()
+        list_time = time.monotonic() - start
+        list_requests = standin.requests
+
+        fetch_time = None
+        failed = 0
+        if clone:
+            shutil.rmtree(path, ignore_errors=True)
+            start = time.monotonic()
+            summary = fetcher.fetch()
+            fetch_time = time.monotonic() - start
+            failed = len(summary['failed'])
+
+    return {
+        'n': n,
+        'listed': len(listed),
+        'list_requests': list_requests,
+        'list_time': list_time,
+        'fetch_time': fetch_time,
+        'failed': failed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="fetch_bench")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[50, 500, 5000])
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Simulated API latency per request, in seconds.")
+    parser.add_argument("-j", "--jobs", type=int, default=8,
+                        help="Concurrent clones.")
+    parser.add_argument("--clone", default="full",
+                        help="Clone strategy, or `none` to only list.")
+    args = parser.parse_args()
+
+    clone = False if args.clone == "none" else args.clone
+
+    print(f"{'repos':>6} {'listed':>6} {'reqs':>5} {'list (s)':>9} "
+          f"{'fetch (s)':>10} {'repos/s':>8} {'failed':>6}")
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as root:
+            r = bench(root, n, args.latency, args.jobs, clone)
+        fetch = f"{r['fetch_time']:.2f}" if r['fetch_time'] else "-"
+        rate = f"{n / r['fetch_time']:.1f}" if r['fetch_time'] else "-"
+        print(f"{r['n']:>6} {r['listed']:>6} {r['list_requests']:>5} "
+              f"{r['list_time']:>9.2f} {fetch:>10} {rate:>8} {r['failed']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Offline stand-in for the parts of GitHub(R)'s REST API that Fetcher uses,
+backed by a fixture org of locally generated bare repos reachable through
+`file://` URLs.
+
+Point Fetcher at it with the `GITHUB_API` environment variable and a
+`fetch.remote` of `standin.remote`:
+
+    org = make_fixture_org(root, "org", 50)
+    with GitHubStandIn("org", org, latency=0.05) as standin:
+        os.environ["GITHUB_API"] = standin.url
+        config["fetch"]["remote"] = standin.remote
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+import subprocess
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, urlencode
+
+
+_FMT = "%Y-%m-%dT%H:%M:%SZ"
+
+# Sources committed to every fixture repo.
+_FILES = {
+    "HashTable.hpp": "class HashTable {\npublic:\n\tint getSize();\n};\n",
+    "HashTable.cpp": "#include \"HashTable.hpp\"\n\n"
+                     "int HashTable::getSize() { return 0; }\n",
+    "main.cpp": "int main() { return 0; }\n",
+    "README.md": "# Milestone\n",
+    "build/a.out": "\x7fELF",
+}
+
+
+def _git(*args, cwd=None):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def make_fixture_org(root, org, n, fmilestone="milestone-5",
+                     glob="cachemanager-bst",
+                     pushed_at=datetime(2025, 2, 1), create=True):
+    """
+    Generate an org of `n` student repos as bare repos under `root/org`.
+
+    One template repo is committed and then copied, so generating thousands
+    of repos stays cheap.
+
+    :param create: Create the bare repos. Listing-only callers can skip it.
+    :return: The org's repo listing, as the API would return it.
+    """
+    template = os.path.join(root, ".template.git")
+    if create and not os.path.isdir(template):
+        work = os.path.join(root, ".template")
+        os.makedirs(work)
+        for name, data in _FILES.items():
+            os.makedirs(os.path.dirname(os.path.join(work, name)),
+                        exist_ok=True)
+            with open(os.path.join(work, name), "w") as file:
+                file.write(data)
+        _git("init", "-q", "-b", "main", cwd=work)
+        _git("add", ".", cwd=work)
+        _git("-c", "user.name=standin", "-c", "user.email=standin@localhost",
+             "commit", "-q", "-m", "Initial commit", cwd=work)
+        _git("clone", "-q", "--bare", work, template)
+        shutil.rmtree(work)
+
+    repos = []
+    for i in range(n):
+        name = f"{fmilestone}-{glob}-user{i}"
+        path = os.path.join(root, org, f"{name}.git")
+        if create and not os.path.isdir(path):
+            shutil.copytree(template, path)
+        pushed = pushed_at + timedelta(minutes=i)
+        repos.append({
+            'id': i,
+            'name': name,
+            'full_name': f"{org}/{name}",
+            'created_at': (pushed_at - timedelta(days=7)).strftime(_FMT),
+            'pushed_at': pushed.strftime(_FMT),
+            'size': 4,
+            'clone_url': f"file://{os.path.abspath(path)}",
+        })
+    return repos
+
+
+class GitHubStandIn:
+    def __init__(self, org, repos, latency=0.0, rate_limit=5000, window=3600,
+                 search=True):
+        """
+        :param org: The org to serve.
+        :param repos: The org's repo listing (see `make_fixture_org()`).
+        :param latency: Seconds to delay each response by.
+        :param rate_limit: Requests allowed per window before responding 403.
+        :param window: Seconds until the rate limit resets.
+        :param search: Serve the search API (otherwise it 404s).
+        """
+        self.org = org
+        self.search = search
+        self.repos = repos
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.remaining = rate_limit
+        self.window = window
+        self.reset = int(time.time()) + window
+        self.requests = 0
+        self._errors = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def remote(self):
+        """`fetch.remote` format string for the fixture org's bare repos."""
+        url = self.repos[0]['clone_url'] if self.repos else ""
+        return os.path.dirname(url) + "/{name}.git"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def fail_next(self, n, status=502, retry_after=None):
+        """Fail the next `n` requests with `status`."""
+        headers = {}
+        if retry_after is not None:
+            headers['Retry-After'] = str(retry_after)
+        with self._lock:
+            self._errors.extend([(status, headers)] * n)
+
+    def _take(self):
+        """Count a request against the rate limit; False if exhausted."""
+        with self._lock:
+            self.requests += 1
+            if time.time() >= self.reset:
+                self.remaining = self.rate_limit
+                self.reset = int(time.time()) + self.window
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def _error(self):
+        with self._lock:
+            return self._errors.pop(0) if self._errors else None
+
+    def _rate_headers(self):
+        return {
+            'X-RateLimit-Limit': str(self.rate_limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset': str(self.reset),
+        }
+
+    def _paged(self, repos, path, query):
+        """Slice `repos` into a GitHub(R)-style page with `Link` headers."""
+        page = int(query.get('page', ['1'])[0])
+        per_page = min(int(query.get('per_page', ['30'])[0]), 100)
+        last = max(1, -(-len(repos) // per_page))
+        body = repos[(page - 1) * per_page:page * per_page]
+
+        links = []
+        for rel, n in (("next", page + 1), ("last", last)):
+            if rel == "next" and page >= last:
+                continue
+            params = {k: v[0] for k, v in query.items()}
+            params.update({'page': n, 'per_page': per_page})
+            links.append(
+                f'<{self.url}{path}?{urlencode(params)}>; rel="{rel}"'
+            )
+        headers = {'Link': ", ".join(links)} if last > 1 else {}
+        return body, headers
+
+    def list_repos(self, path, query):
+        """Serve `/orgs/<org>/repos`."""
+        body, headers = self._paged(self.repos, path, query)
+        return 200, body, headers
+
+    def search_repos(self, path, query):
+        """
+        Serve `/search/repositories` for the qualifiers Fetcher uses:
+        `org:`, `in:name` name terms and `pushed:>=`/`pushed:>`.
+        """
+        if not self.search:
+            return 404, {'message': "Not Found"}, {}
+
+        terms = []
+        org = None
+        pushed = None
+        for token in query.get('q', [''])[0].split():
+            if token.startswith("org:"):
+                org = token[4:]
+            elif token.startswith("pushed:"):
+                pushed = token[7:]
+            elif token != "in:name":
+                terms.append(token)
+
+        matched = []
+        for repo in self.repos:
+            if org != self.org:
+                break
+            if not all(term in repo['name'] for term in terms):
+                continue
+            if pushed is not None:
+                date = repo['pushed_at'][:10]
+                if pushed.startswith(">="):
+                    if date < pushed[2:]:
+                        continue
+                elif pushed.startswith(">") and date <= pushed[1:]:
+                    continue
+            matched.append(repo)
+
+        items, headers = self._paged(matched, path, query)
+        body = {
+            'total_count': len(matched),
+            'incomplete_results': False,
+            'items': items,
+        }
+        return 200, body, headers
+
+    def _bare(self, name):
+        """Return the path of a fixture repo's bare repo, or None."""
+        for repo in self.repos:
+            if repo['name'] == name:
+                return urlparse(repo['clone_url']).path
+        return None
+
+    def get_repo(self, name):
+        """Serve `/repos/<org>/<repo>`."""
+        for repo in self.repos:
+            if repo['name'] == name:
+                return 200, repo, {}
+        return 404, {'message': "Not Found"}, {}
+
+    def commits(self, name, query):
+        """
+        Serve `/repos/<org>/<repo>/commits`, newest first, honouring `until`
+        and `per_page`.
+        """
+        bare = self._bare(name)
+        if bare is None:
+            return 404, {'message': "Not Found"}, {}
+        cmd = ["git", "--git-dir", bare, "log", "--format=%H",
+               f"-n{query.get('per_page', ['30'])[0]}"]
+        if 'until' in query:
+            cmd.append(f"--before={query['until'][0]}")
+        shas = subprocess.run(cmd + ["HEAD"], capture_output=True,
+                              text=True).stdout.split()
+        return 200, [{'sha': sha} for sha in shas], {}
+
+    def tarball(self, name, ref):
+        """Serve `/repos/<org>/<repo>/tarball[/<ref>]` via `git archive`."""
+        bare = self._bare(name)
+        if bare is None:
+            return 404, {'message': "Not Found"}, {}
+        ref = ref or "HEAD"
+        sha = subprocess.run(
+            ["git", "--git-dir", bare, "rev-parse", "--short", ref],
+            capture_output=True, text=True
+        ).stdout.strip()
+        archive = subprocess.run(
+            ["git", "--git-dir", bare, "archive", "--format=tar.gz",
+             f"--prefix={self.org}-{name}-{sha}/", ref],
+            capture_output=True
+        )
+        if archive.returncode != 0:
+            return 404, {'message': "No commit found for the ref"}, {}
+        return 200, archive.stdout, {'Content-Type': "application/x-gzip"}
+
+    def route(self, path, query):
+        """Return `(status, body, headers)` for a GET, or None if unknown."""
+        if path == f"/orgs/{self.org}/repos":
+            return self.list_repos(path, query)
+        if path == "/search/repositories":
+            return self.search_repos(path, query)
+        match = re.fullmatch(f"/repos/{self.org}/([^/]+)/tarball(?:/(.+))?",
+                             path)
+        if match:
+            return self.tarball(match[1], match[2])
+        match = re.fullmatch(f"/repos/{self.org}/([^/]+)/commits", path)
+        if match:
+            return self.commits(match[1], query)
+        match = re.fullmatch(f"/repos/{self.org}/([^/]+)", path)
+        if match:
+            return self.get_repo(match[1])
+        return None
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b"", headers={}):
+                self.send_response(status)
+                for k, v in standin._rate_headers().items():
+                    self.send_header(k, v)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if standin.latency:
+                    time.sleep(standin.latency)
+                if not standin._take():
+                    self._send(403, b'{"message": "API rate limit exceeded"}')
+                    return
+                error = standin._error()
+                if error:
+                    self._send(error[0], b'{"message": "Injected error"}',
+                               error[1])
+                    return
+
+                url = urlparse(self.path)
+                routed = standin.route(url.path, parse_qs(url.query))
+                if routed is None:
+                    self._send(404, b'{"message": "Not Found"}')
+                    return
+
+                status, body, headers = routed
+                if isinstance(body, bytes):
+                    self._send(status, body, headers)
+                    return
+
+                body = json.dumps(body).encode()
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    self._send(304, headers={'ETag': etag})
+                    return
+                self._send(status, body, dict(
+                    headers, ETag=etag, **{'Content-Type': "application/json"}
+                ))
+
+        return Handler
@@ -0,0 +1,93 @@
+from core.bundle import Bundler
+from core.fetch import Fetcher
+from core.manifest import Manifest
+from tests.github_standin import GitHubStandIn, make_fixture_org
+
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+import subprocess
+
+
+# Local globals:
+_milestone = "milestone5"
+_config = {
+    "prof": "hugh",
+    "org": "org",
+    "clone": True,
+    "glob": "cachemanager-bst",
+    "fetch": {
+        "clear": False,
+        "cache": False,
+    },
+}
+
+
+def _git(dir, *args):
+    return subprocess.run(["git", "-C", dir, *args], capture_output=True,
+                          text=True).stdout.strip()
+
+
+class TestBundler(unittest.TestCase):
+    def setUp(self):
+        self._root = tempfile.TemporaryDirectory()
+        self.root = self._root.name
+        self.path = os.path.join(self.root, "repos")
+        self.out = os.path.join(self.root, "export")
+        self.node = os.path.join(self.root, "node", "repos")
+
+    def tearDown(self):
+        self._root.cleanup()
+
+    def _fetch(self, n, clone=True):
+        repos = make_fixture_org(self.root, "org", n)
+        with GitHubStandIn("org", repos) as standin:
+            cfg = dict(_config, clone=clone)
+            cfg["fetch"] = dict(_config["fetch"], remote=standin.remote)
+            with patch.dict(os.environ, {"GITHUB_API": standin.url}):
+                Fetcher(_milestone, cfg, path=self.path).fetch()
+        return repos
+
+    def test_round_trip(self):
+        repos = self._fetch(3)
+        summary = Bundler(self.path, workers=2).pack(self.out)
+        self.assertEqual(summary["failed"], [])
+        self.assertEqual(
+            sorted(f for f in os.listdir(self.out) if not f.startswith(".")),
+            sorted(f"{r['name']}.bundle" for r in repos)
+        )
+
+        summary = Bundler(self.node, workers=2).unpack(self.out)
+        self.assertEqual(summary["failed"], [])
+        records = Manifest(self.node).load()
+        for repo in repos:
+            name = repo["name"]
+            dir = os.path.join(self.node, name)
+            self.assertEqual(_git(dir, "rev-parse", "HEAD"),
+                             records[name]["head"])
+            self.assertEqual(_git(dir, "remote", "get-url", "origin"),
+                             _git(os.path.join(self.path, name), "remote",
+                                  "get-url", "origin"))
+            self.assertTrue(os.path.isfile(os.path.join(dir, "main.cpp")))
+            self.assertEqual(records[name]["path"], f"{self.node}/{name}")
+            self.assertNotIn("bundle", records[name])
+
+    def test_round_trip_archived(self):
+        repos = self._fetch(2, clone="tarball")
+        summary = Bundler(self.path).pack(self.out)
+        self.assertEqual({r["status"] for r in summary["results"]},
+                         {"archived"})
+
+        Bundler(self.node).unpack(self.out)
+        dir = os.path.join(self.node, repos[0]["name"])
+        self.assertEqual(sorted(os.listdir(dir)),
+                         ["HashTable.cpp", "HashTable.hpp", "main.cpp"])
+
+    def test_pack_without_manifest(self):
+        with self.assertRaises(FileNotFoundError):
+            Bundler(self.path).pack(self.out)
+
+
+if __name__ == "__main__":
+    unittest.main()
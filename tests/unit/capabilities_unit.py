@@ -0,0 +1,86 @@
+from core.capabilities import Capabilities, capabilities, reset_capabilities
+from core.shell import Shell
+
+import unittest
+from unittest.mock import patch
+import os
+import stat
+import subprocess
+import tempfile
+
+
+_run = subprocess.run
+
+
+class TestCapabilities(unittest.TestCase):
+    def setUp(self):
+        self._root = tempfile.TemporaryDirectory()
+        self.bin = os.path.join(self._root.name, "bin")
+        self.cache = os.path.join(self._root.name, "cache")
+        os.makedirs(self.bin)
+        self.tool = os.path.join(self.bin, "gcfake")
+        self._write_tool("gcfake 1.0")
+        self._path = patch.dict(os.environ, {
+            "PATH": self.bin + os.pathsep + os.environ["PATH"]
+        })
+        self._path.start()
+        reset_capabilities()
+
+    def tearDown(self):
+        self._path.stop()
+        reset_capabilities()
+        self._root.cleanup()
+
+    def _write_tool(self, version, code=0):
+        with open(self.tool, "w") as file:
+            file.write(f"#!/bin/sh\necho '{version}'\nexit {code}\n")
+        os.chmod(self.tool, os.stat(self.tool).st_mode | stat.S_IXUSR)
+
+    def _count(self):
+        """ Count processes spawned through `subprocess.run`. """
+        calls = []
+        def run(*args, **kwargs):
+            calls.append(args[0])
+            return _run(*args, **kwargs)
+        return calls, patch("subprocess.run", side_effect=run)
+
+    def test_get(self):
+        caps = Capabilities()
+        tool = caps.get("gcfake")
+        self.assertEqual(tool["path"], self.tool)
+        self.assertEqual(tool["version"], "gcfake 1.0")
+        self.assertTrue(caps.has("gcfake"))
+        self.assertIsNone(caps.get("gcmissing"))
+        self.assertIsNone(caps.path("gcmissing"))
+
+    def test_broken_tool(self):
+        self._write_tool("broken", code=1)
+        self.assertFalse(Capabilities().has("gcfake"))
+
+    def test_probed_once_per_process(self):
+        calls, run = self._count()
+        with run:
+            for _ in range(10):
+                Shell()
+                capabilities().has("gcfake")
+        # One `grep --version`, one `gcfake --version`.
+        self.assertEqual(len(calls), 2)
+
+    def test_persisted_per_host(self):
+        Capabilities(self.cache).get("gcfake")
+        calls, run = self._count()
+        with run:
+            self.assertEqual(Capabilities(self.cache).get("gcfake")["version"],
+                             "gcfake 1.0")
+        self.assertEqual(calls, [])
+
+        # A changed executable is probed again.
+        self._write_tool("gcfake 2.0 (newer)")
+        with run:
+            self.assertEqual(Capabilities(self.cache).get("gcfake")["version"],
+                             "gcfake 2.0 (newer)")
+        self.assertEqual(len(calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,537 @@
+from core.fetch import Fetcher, load_roster
+from core.http_cache import HttpCache
+from core.manifest import Manifest
+from tests.github_standin import GitHubStandIn, make_fixture_org
+from tools import util
+
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import json
+import tempfile
+import subprocess
+from datetime import datetime
+
+
+# Local globals:
+_milestone = "milestone5"
+_config = {
+    "prof": "hugh",
+    "org": "org",
+    "clone": False,
+    "glob": "cachemanager-bst",
+    "fetch": {
+        "clear": False,
+        "cache": False,
+    },
+}
+
+
+def _page_response(page, last=None, status=200, size=100):
+    """ Helper function to create a mock listing page response. """
+    response = MagicMock()
+    response.status_code = status
+    response.json.return_value = [
+        {
+            "name": f"milestone-5-cachemanager-bst-user{page}",
+            "created_at": "2025-02-01T00:00:00Z",
+            "pushed_at": "2025-02-01T00:00:00Z",
+            "size": size * page,
+        }
+    ]
+    response.links = {}
+    if last is not None:
+        response.links = {
+            "last": {
+                "url": f"https://api.github.com/orgs/org/repos?page={last}"
+            }
+        }
+    response.headers = {}
+    return response
+
+
+class TestFetcher(unittest.TestCase):
+    def setUp(self):
+        self.fetcher = Fetcher(_milestone, _config)
+
+    @patch("requests.Session.get")
+    def test_list_repos_single_page(self, mock_get):
+        mock_get.return_value = _page_response(1)
+        repos = self.fetcher._list_repos()
+        self.assertEqual(len(repos), 1)
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(mock_get.call_args.kwargs["params"]["per_page"], 100)
+        self.assertEqual(mock_get.call_args.kwargs["timeout"], (5, 30))
+
+    def test_session(self):
+        session = self.fetcher._session
+        self.assertIn("Authorization", session.headers)
+        self.assertIn("gzip", session.headers["Accept-Encoding"])
+        adapter = session.get_adapter("https://api.github.com")
+        self.assertEqual(adapter.max_retries.connect, 3)
+        self.assertEqual(adapter.max_retries.status, 0)
+
+    @patch("requests.Session.get")
+    def test_list_repos_pages_in_order(self, mock_get):
+        mock_get.side_effect = lambda url, params, **kwargs: _page_response(
+            params["page"], last=5
+        )
+        repos = self.fetcher._list_repos()
+        self.assertEqual(
+            [repo["name"] for repo in repos],
+            [f"milestone-5-cachemanager-bst-user{i}" for i in range(1, 6)]
+        )
+        self.assertEqual(mock_get.call_count, 5)
+
+    @patch("requests.Session.get")
+    def test_list_repos_bad_status(self, mock_get):
+        mock_get.return_value = _page_response(1, status=500)
+        self.fetcher._scheduler._sleep = lambda delay: None
+        with self.assertRaises(RuntimeError):
+            self.fetcher._list_repos()
+        # The first attempt, then every retry.
+        self.assertEqual(mock_get.call_count, 6)
+
+    @patch("requests.Session.get")
+    def test_fetch_clone_summary(self, mock_get):
+        mock_get.side_effect = lambda url, params, **kwargs: _page_response(
+            params["page"], last=3
+        )
+        codes = {
+            "milestone-5-cachemanager-bst-user2": 128,
+        }
+        def cmd(c):
+            name = c.rsplit("/", 1)[1]
+            return "", "", codes.get(name, 0)
+
+        with tempfile.TemporaryDirectory() as path:
+            fetcher = Fetcher(_milestone, dict(_config, clone=True), path=path,
+                              workers=2)
+            with patch.object(fetcher._shell, "cmd", side_effect=cmd):
+                summary = fetcher.fetch()
+
+        self.assertEqual(len(summary["results"]), 3)
+        self.assertEqual(summary["failed"],
+                         ["milestone-5-cachemanager-bst-user2"])
+        for r in summary["results"]:
+            self.assertIn("duration", r)
+            self.assertIn("code", r)
+
+    @patch("requests.Session.get")
+    def test_fetch_incremental(self, mock_get):
+        mock_get.side_effect = lambda url, params, **kwargs: _page_response(
+            params["page"], last=3
+        )
+        with tempfile.TemporaryDirectory() as path:
+            # user1 is unchanged, user2 was pushed to, user3 is new.
+            for i in (1, 2):
+                os.makedirs(
+                    f"{path}/milestone-5-cachemanager-bst-user{i}/.git"
+                )
+            Manifest(path).save({
+                "milestone-5-cachemanager-bst-user1": {
+                    "name": "milestone-5-cachemanager-bst-user1",
+                    "head": "a" * 40,
+                    "pushed_at": "2025-02-01T00:00:00Z",
+                },
+                "milestone-5-cachemanager-bst-user2": {
+                    "name": "milestone-5-cachemanager-bst-user2",
+                    "head": "b" * 40,
+                    "pushed_at": "2025-01-15T00:00:00Z",
+                },
+            })
+
+            fetcher = Fetcher(_milestone, dict(_config, clone=True), path=path,
+                              incremental=True)
+            def cmd(c):
+                if "rev-parse" in c:
+                    return "c" * 40 + "\n", "", 0
+                return "", "", 0
+
+            with patch.object(fetcher._shell, "cmd",
+                              side_effect=cmd) as mock_cmd:
+                summary = fetcher.fetch()
+
+            statuses = {r["name"][-5:]: r["status"] for r in summary["results"]}
+            self.assertEqual(statuses, {
+                "user1": "unchanged",
+                "user2": "updated",
+                "user3": "cloned",
+            })
+            # One git command and one `rev-parse` per changed repo.
+            git = [c for c in mock_cmd.call_args_list
+                   if not c.args[0].startswith("ssh ")]
+            self.assertEqual(len(git), 4)
+
+            records = Manifest(path).load()
+            self.assertEqual(len(records), 3)
+            user1 = records["milestone-5-cachemanager-bst-user1"]
+            self.assertEqual(user1["head"], "a" * 40)
+            user3 = records["milestone-5-cachemanager-bst-user3"]
+            self.assertEqual(user3["head"], "c" * 40)
+            self.assertEqual(user3["username"], "user3")
+            self.assertEqual(user3["pushed_at"], "2025-02-01T00:00:00Z")
+
+    @patch("requests.Session.get")
+    def test_list_repos_not_modified(self, mock_get):
+        with tempfile.TemporaryDirectory() as path:
+            self.fetcher._cache = HttpCache(path=path)
+
+            response = _page_response(1)
+            response.headers = {"ETag": '"abc"'}
+            mock_get.return_value = response
+            self.fetcher._list_repos()
+
+            # Second run revalidates and is served from the cache.
+            not_modified = _page_response(1, status=304)
+            not_modified.json.side_effect = AssertionError("parsed body")
+            mock_get.return_value = not_modified
+            repos = self.fetcher._list_repos()
+
+            headers = mock_get.call_args.kwargs["headers"]
+            self.assertEqual(headers["If-None-Match"], '"abc"')
+            self.assertEqual(len(repos), 1)
+
+    def test_cache_ttl_and_refresh(self):
+        with tempfile.TemporaryDirectory() as path:
+            response = _page_response(1)
+            response.headers = {"ETag": '"abc"'}
+            HttpCache(path=path).put("url", {"page": 1}, response, [])
+
+            self.assertIsNotNone(HttpCache(path=path).get("url", {"page": 1}))
+            self.assertIsNone(
+                HttpCache(path=path, ttl=-1).get("url", {"page": 1})
+            )
+            self.assertIsNone(
+                HttpCache(path=path, refresh=True).get("url", {"page": 1})
+            )
+
+    @patch("requests.Session.get")
+    def test_fetch_oversize(self, mock_get):
+        # user1 is 100 KB, user2 200 KB, user3 300 KB.
+        mock_get.side_effect = lambda url, params, **kwargs: _page_response(
+            params["page"], last=3
+        )
+        cmds = []
+        def cmd(c):
+            cmds.append(c)
+            return "", "", 0
+
+        for action, expect in (("defer", "user1"), ("sparse", "user3")):
+            with tempfile.TemporaryDirectory() as path:
+                cfg = dict(_config, clone=True, fetch=dict(
+                    _config["fetch"], max_size=150, oversize=action,
+                    ssh_multiplex=False
+                ))
+                fetcher = Fetcher(_milestone, cfg, path=path, workers=1)
+                cmds.clear()
+                with patch.object(fetcher._shell, "cmd", side_effect=cmd):
+                    summary = fetcher.fetch()
+
+            self.assertEqual(summary["throttled"], [
+                "milestone-5-cachemanager-bst-user2",
+                "milestone-5-cachemanager-bst-user3",
+            ])
+            clones = [c for c in cmds if " clone " in c]
+            if action == "defer":
+                # Within the limit goes first; oversize at the back.
+                self.assertIn(expect, clones[0])
+            else:
+                self.assertIn("sparse-checkout", [c for c in clones
+                                                  if expect in c][0])
+                self.assertNotIn("sparse-checkout", clones[0])
+
+    def test_oversize_with_deadlines(self):
+        cfg = dict(_config, clone=True, deadlines={"initial": "2025-02-10"},
+                   fetch=dict(_config["fetch"], max_size=150,
+                              oversize="shallow"))
+        fetcher = Fetcher(_milestone, cfg)
+        # Snapshots need history: not shallow.
+        self.assertEqual(fetcher._oversize({"size": 200}), "sparse")
+        self.assertIsNone(fetcher._oversize({"size": 100}))
+
+    def test_clone_cmd_strategies(self):
+        fetcher = Fetcher(_milestone, dict(_config, clone="shallow",
+                                           files=["milestone5.json"]))
+        name = "milestone-5-cachemanager-bst-user1"
+        self.assertIn("--depth 1", fetcher._clone_cmd(name, "shallow"))
+        self.assertIn("--filter=blob:none",
+                      fetcher._clone_cmd(name, "blobless"))
+        sparse = fetcher._clone_cmd(name, "sparse")
+        self.assertIn("sparse-checkout set --no-cone", sparse)
+        self.assertIn("'*.cpp'", sparse)
+        self.assertIn("'milestone5.json'", sparse)
+        self.assertNotIn("--", fetcher._clone_cmd(name, "full"))
+
+    def test_clone_cmd_reference(self):
+        fetcher = Fetcher(_milestone, dict(_config, clone=True, fetch={
+            "clear": False,
+            "cache": False,
+            "reference": True,
+            "dissociate": True,
+        }))
+        cmd = fetcher._clone_cmd("milestone-5-cachemanager-bst-user1", "full")
+        self.assertIn("--reference-if-able ", cmd)
+        self.assertIn("repos/.reference/org.git", cmd)
+        self.assertIn("--dissociate", cmd)
+
+    def test_ssh_multiplex(self):
+        fetcher = Fetcher(_milestone, dict(_config, clone=True))
+        self.assertEqual(fetcher._ssh_host, "git@github.com")
+        with patch.object(fetcher._shell, "cmd",
+                          return_value=("", "", 0)) as mock_cmd:
+            fetcher._start_ssh()
+            self.assertIn("-fN git@github.com", mock_cmd.call_args.args[0])
+            cmd = fetcher._clone_cmd("milestone-5-cachemanager-bst-user1",
+                                     "full")
+            self.assertTrue(cmd.startswith("GIT_SSH_COMMAND='ssh "))
+            self.assertIn("ControlPath=", cmd)
+
+            dir = fetcher._ssh_dir
+            fetcher._stop_ssh()
+            self.assertIn("-O exit", mock_cmd.call_args.args[0])
+        self.assertFalse(os.path.isdir(dir))
+        self.assertTrue(fetcher._clone_cmd("repo", "full").startswith("git "))
+
+    def test_ssh_multiplex_not_ssh(self):
+        fetcher = Fetcher(_milestone, dict(_config, fetch=dict(
+            _config["fetch"], remote="file:///tmp/{org}/{name}.git"
+        )))
+        self.assertIsNone(fetcher._ssh_host)
+        fetcher._start_ssh()
+        self.assertEqual(fetcher._git, "git")
+
+    def test_load_roster(self):
+        with tempfile.TemporaryDirectory() as path:
+            rosters = {
+                "roster.json": '["user1", {"username": "user2"}, "user1"]',
+                "roster.csv": "name,username\nOne,user1\nTwo,user2\n",
+                "plain.csv": "user1\nuser2\n\n",
+            }
+            for name, data in rosters.items():
+                with open(os.path.join(path, name), "w") as file:
+                    file.write(data)
+                self.assertEqual(load_roster(os.path.join(path, name)),
+                                 ["user1", "user2"])
+
+    def test_clone_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            Fetcher(_milestone, dict(_config, clone="deep"))
+
+
+class TestFetcherStandIn(unittest.TestCase):
+    """ Fetcher end to end against the offline GitHub(R) stand-in. """
+    def setUp(self):
+        self._root = tempfile.TemporaryDirectory()
+        self.root = self._root.name
+        self.path = os.path.join(self.root, "repos")
+
+    def tearDown(self):
+        self._root.cleanup()
+
+    def _fetcher(self, standin, clone=True, **kwargs):
+        cfg = dict(_config, clone=clone)
+        cfg["fetch"] = dict(_config["fetch"], remote=standin.remote)
+        with patch.dict(os.environ, {"GITHUB_API": standin.url}):
+            return Fetcher(_milestone, cfg, path=self.path, **kwargs)
+
+    def test_list_paginated(self):
+        repos = make_fixture_org(self.root, "org", 250, create=False)
+        with GitHubStandIn("org", repos) as standin:
+            listed = self._fetcher(standin)._list_repos()
+            self.assertEqual(standin.requests, 3)
+        self.assertEqual([r["name"] for r in listed],
+                         [r["name"] for r in repos])
+
+    def test_list_retries_errors(self):
+        repos = make_fixture_org(self.root, "org", 250, create=False)
+        with GitHubStandIn("org", repos) as standin:
+            fetcher = self._fetcher(standin)
+            fetcher._scheduler._sleep = lambda delay: None
+            standin.fail_next(2, status=502)
+            standin.fail_next(1, status=403, retry_after=0)
+            listed = fetcher._list_repos()
+        self.assertEqual(len(listed), 250)
+
+    def _search_org(self):
+        # 150 current milestone repos among 250 repos of other milestones.
+        return (
+            make_fixture_org(self.root, "org", 150, create=False) +
+            make_fixture_org(self.root, "org", 250, fmilestone="milestone-4",
+                             create=False)
+        )
+
+    def test_search(self):
+        repos = self._search_org()
+        with GitHubStandIn("org", repos) as standin:
+            fetcher = self._fetcher(standin)
+            fetcher._discovery = "search"
+            found = fetcher._discover()
+            self.assertEqual(standin.requests, 2)
+        self.assertEqual([r["name"] for r in found],
+                         [r["name"] for r in repos[:150]])
+
+    def test_search_fallback(self):
+        repos = self._search_org()
+        with GitHubStandIn("org", repos, search=False) as standin:
+            fetcher = self._fetcher(standin)
+            fetcher._discovery = "search"
+            found = fetcher._discover()
+            # One failed search, then the full listing.
+            self.assertEqual(standin.requests, 1 + 4)
+        self.assertEqual(len(found), 400)
+
+    def test_fetch_roster(self):
+        repos = make_fixture_org(self.root, "org", 3)
+        roster = os.path.join(self.root, "roster.json")
+        with open(roster, "w") as file:
+            json.dump(["user0", "ghost", "user2"], file)
+
+        with GitHubStandIn("org", repos) as standin:
+            fetcher = self._fetcher(standin, roster=roster)
+            # Rostered repos are fetched however long ago they were pushed.
+            fetcher._push_mindate = datetime(2030, 1, 1)
+            summary = fetcher.fetch()
+            # One request per roster entry; the org is never listed.
+            self.assertEqual(standin.requests, 3)
+
+        self.assertEqual(summary["missing"], ["ghost"])
+        self.assertEqual([r["name"][-5:] for r in summary["results"]],
+                         ["user0", "user2"])
+        records = Manifest(self.path).load()
+        ghost = records["milestone-5-cachemanager-bst-ghost"]
+        self.assertEqual(ghost["status"], "missing")
+        self.assertIsNone(ghost["head"])
+
+    def test_fetch_clones(self):
+        repos = make_fixture_org(self.root, "org", 3)
+        with GitHubStandIn("org", repos) as standin:
+            summary = self._fetcher(standin, workers=2).fetch()
+        self.assertEqual(summary["failed"], [])
+        for repo in repos:
+            self.assertTrue(os.path.isfile(
+                os.path.join(self.path, repo["name"], "HashTable.cpp")
+            ))
+        records = Manifest(self.path).load()
+        self.assertTrue(all(len(r["head"]) == 40 for r in records.values()))
+
+    def test_fetch_one(self):
+        repos = make_fixture_org(self.root, "org", 3)
+        name = repos[1]["name"]
+        with GitHubStandIn("org", repos) as standin:
+            fetcher = self._fetcher(standin)
+            self.assertEqual(fetcher.fetch_one(name)["status"], "cloned")
+            self.assertEqual(fetcher.fetch_one(name)["status"], "updated")
+            self.assertIsNone(fetcher.fetch_one("unrelated"))
+            # Only the pushed repo is requested; the org is never listed.
+            self.assertEqual(standin.requests, 3)
+        self.assertEqual(os.listdir(self.path).count(name), 1)
+        records = Manifest(self.path).load()
+        self.assertEqual(list(records), [name])
+        self.assertEqual(records[name]["status"], "updated")
+
+    def test_fetch_tarball(self):
+        repos = make_fixture_org(self.root, "org", 2)
+        with GitHubStandIn("org", repos) as standin:
+            summary = self._fetcher(standin, clone="tarball").fetch()
+        self.assertEqual(summary["failed"], [])
+        self.assertEqual({r["status"] for r in summary["results"]},
+                         {"downloaded"})
+        dir = os.path.join(self.path, repos[0]["name"])
+        self.assertEqual(sorted(os.listdir(dir)),
+                         ["HashTable.cpp", "HashTable.hpp", "main.cpp"])
+        records = Manifest(self.path).load()
+        self.assertTrue(all(len(r["head"]) == 40 for r in records.values()))
+
+    def test_snapshot_tarball(self):
+        repos = make_fixture_org(self.root, "org", 2)
+        name = repos[0]["name"]
+        with GitHubStandIn("org", repos) as standin:
+            fetcher = self._fetcher(standin, clone="tarball")
+            fetcher._deadlines = {"initial": "2099-12-31T00:00:00",
+                                  "early": "2000-01-01T00:00:00"}
+            summary = fetcher.fetch()
+
+        snapshot = summary["snapshots"]["initial"][name]
+        self.assertEqual(snapshot["status"], "snapshot")
+        self.assertEqual(snapshot["head"],
+                         Manifest(self.path).load()[name]["head"])
+        self.assertTrue(os.path.isfile(os.path.join(
+            f"{self.path}-initial", name, "HashTable.cpp"
+        )))
+        self.assertEqual(summary["snapshots"]["early"][name]["status"],
+                         "missing")
+
+    def test_snapshot_deadlines(self):
+        name = "milestone-5-cachemanager-bst-user1"
+        dir = os.path.join(self.path, name)
+        os.makedirs(dir)
+        def git(*args, date=None):
+            env = dict(os.environ, GIT_AUTHOR_DATE=date or "",
+                       GIT_COMMITTER_DATE=date or "")
+            subprocess.run(["git", "-C", dir, *args], check=True, env=env,
+                           capture_output=True)
+        git("init", "-q")
+        for i, date in enumerate(["2025-02-01T12:00:00",
+                                  "2025-02-20T12:00:00"]):
+            with open(os.path.join(dir, "main.cpp"), "w") as file:
+                file.write(f"// v{i}\n")
+            git("add", ".")
+            git("-c", "user.name=a", "-c", "user.email=a@b", "commit", "-q",
+                "-m", f"v{i}", date=date)
+
+        cfg = dict(_config, clone=True, deadlines={
+            "initial": "2025-02-10T23:59:59",
+            "resubmission": "2025-02-24T23:59:59",
+            "early": "2025-01-01T00:00:00",
+        })
+        fetcher = Fetcher(_milestone, cfg, path=self.path)
+        records = {name: {"name": name, "path": dir, "head": "x"}}
+        snapshots = fetcher._snapshot(records)
+
+        for deadline, version in (("initial", "v0"), ("resubmission", "v1")):
+            snap = os.path.join(f"{self.path}-{deadline}", name, "main.cpp")
+            with open(snap) as file:
+                self.assertEqual(file.read(), f"// {version}\n")
+            record = Manifest(f"{self.path}-{deadline}").load()[name]
+            self.assertEqual(record["status"], "snapshot")
+        self.assertEqual(snapshots["early"][name]["status"], "missing")
+        self.assertIsNone(snapshots["early"][name]["head"])
+
+    def test_snapshot_shallow(self):
+        repos = make_fixture_org(self.root, "org", 1)
+        name = repos[0]["name"]
+        with GitHubStandIn("org", repos) as standin:
+            fetcher = self._fetcher(standin, clone="blobless")
+            dir = os.path.join(self.path, name)
+            subprocess.run(["git", "clone", "-q", "--depth", "1",
+                            standin.remote.format(org="org", name=name), dir],
+                           check=True, capture_output=True)
+        # The only commit is after the deadline, but older ones may exist.
+        snapshot = fetcher._snapshot_repo(
+            {"name": name, "path": dir, "head": "x"}, "early",
+            "2000-01-01T00:00:00"
+        )
+        self.assertEqual(snapshot["status"], "failed")
+
+    def test_snapshot_after_clear(self):
+        repos = make_fixture_org(self.root, "org", 2)
+        with GitHubStandIn("org", repos) as standin:
+            for run in range(2):
+                fetcher = self._fetcher(standin)
+                fetcher._config = dict(
+                    fetcher._config, fetch=dict(fetcher._config["fetch"],
+                                                clear=True)
+                )
+                fetcher._deadlines = {"initial": "2099-12-31T00:00:00"}
+                summary = fetcher.fetch()
+                self.assertEqual(
+                    {s["status"] for s in summary["snapshots"]["initial"]
+                     .values()},
+                    {"snapshot"}
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,6 @@
 from core.shell import Shell
 from core.build import Build
-from core.file_processor import FileProcessor
+from core.file_processor import FileProcessor, EncodingResolver, MappedFile
 from tools import util
 
 import unittest
@@ -8,6 +8,7 @@ from unittest.mock import patch, mock_open, MagicMock
 import sys
 import subprocess
 import os
+import tempfile
 
 
 _fh = "file1.txt"
@@ -102,5 +103,136 @@ class TestFileProcessor(unittest.TestCase):
             next(iter(processor))  # Should immediately raise StopIteration
 
 
+class TestEncodingResolver(unittest.TestCase):
+    def setUp(self):
+        self._root = tempfile.TemporaryDirectory()
+        self.root = self._root.name
+
+    def tearDown(self):
+        self._root.cleanup()
+
+    def _write(self, name, data):
+        path = os.path.join(self.root, name)
+        with open(path, "wb") as file:
+            file.write(data)
+        return path
+
+    @patch("chardet.detect")
+    def test_utf8_fast_path(self, mock_detect):
+        path = self._write("a.cpp", "// caf\u00e9\r\nint a;\n".encode())
+        resolver = EncodingResolver()
+        self.assertEqual(resolver.resolve(path), "utf-8")
+        mock_detect.assert_not_called()
+
+        path = self._write("bom.cpp", b"\xef\xbb\xbfint a;\n")
+        text, encoding = resolver.decode(path, open(path, "rb").read())
+        self.assertEqual((text, encoding), ("int a;\n", "utf-8-sig"))
+
+    @patch("chardet.detect", return_value={"encoding": "Windows-1252"})
+    def test_detect_sample(self, mock_detect):
+        data = "// caf\u00e9\n".encode("cp1252") * 1000
+        path = self._write("a.cpp", data)
+        resolver = EncodingResolver(sample=128)
+        self.assertEqual(resolver.resolve(path), "Windows-1252")
+        self.assertEqual(len(mock_detect.call_args.args[0]), 128)
+
+        # Same path, size and mtime: not detected again.
+        resolver.resolve(path)
+        self.assertEqual(mock_detect.call_count, 1)
+
+    @patch("chardet.detect", return_value={"encoding": "Windows-1252"})
+    def test_persisted_by_content(self, mock_detect):
+        cache = os.path.join(self.root, "cache", "encodings.json")
+        data = "// caf\u00e9\n".encode("cp1252")
+        EncodingResolver(cache).resolve(self._write("a.cpp", data))
+        # A fresh run, and a different copy of the same file.
+        resolver = EncodingResolver(cache)
+        self.assertEqual(resolver.resolve(self._write("b.cpp", data)),
+                         "Windows-1252")
+        self.assertEqual(mock_detect.call_count, 1)
+
+    def test_file_processor_read(self):
+        path = self._write("a.cpp", "// caf\u00e9\r\nint a;\n".encode())
+        fh, ftype = next(iter(FileProcessor(path, "r")))
+        self.assertEqual(fh.name, path)
+        self.assertEqual(ftype, ".cpp")
+        self.assertEqual(fh.readlines(), ["// caf\u00e9\n", "int a;\n"])
+
+
+class TestMappedFile(unittest.TestCase):
+    def setUp(self):
+        self._root = tempfile.TemporaryDirectory()
+        self.root = self._root.name
+
+    def tearDown(self):
+        self._root.cleanup()
+
+    def _write(self, name, data):
+        path = os.path.join(self.root, name)
+        with open(path, "wb") as file:
+            file.write(data)
+        return path
+
+    def test_search(self):
+        path = self._write("a.cpp", b"// header\r\nint Foo::bar(int x) {\n}\n")
+        with MappedFile(path) as fh:
+            self.assertEqual(fh.name, path)
+            self.assertIn("Foo::bar(", fh)
+            self.assertNotIn("Foo::baz(", fh)
+            offset = fh.find("Foo::bar(")
+            self.assertEqual(fh.line(offset), 1)
+            self.assertEqual(fh.line_text(1), "int Foo::bar(int x) {")
+            self.assertEqual(fh.line_text(0), "// header")
+            self.assertEqual([m.group() for m in fh.finditer(rb"\w+::\w+")],
+                             [b"Foo::bar"])
+            self.assertIsNone(fh.search("Foo::baz"))
+
+    @patch("chardet.detect", return_value={"encoding": "Windows-1252"})
+    def test_decode_lines(self, mock_detect):
+        path = self._write("a.cpp",
+                           "// caf\u00e9\nint a;\n".encode("cp1252"))
+        with MappedFile(path) as fh:
+            # ASCII lines never need the file's encoding.
+            self.assertEqual(fh.line_text(1), "int a;")
+            mock_detect.assert_not_called()
+            self.assertEqual(fh.line_text(0), "// caf\u00e9")
+
+    def test_utf16(self):
+        source = "// caf\u00e9\r\nint Foo::bar(int x) {\n}\n"
+        for encoding in ("utf-16", "utf-32"):
+            path = self._write("a.cpp", source.encode(encoding))
+            with MappedFile(path) as fh:
+                self.assertIn("Foo::bar(", fh)
+                self.assertIn(b"Foo::bar(", fh)
+                self.assertEqual(fh.line(fh.find("Foo::bar(")), 1)
+                self.assertEqual(fh.line_text(0), "// caf\u00e9")
+                self.assertEqual(fh.line_text(1), "int Foo::bar(int x) {")
+                self.assertEqual(fh.search(rb"\w+::\w+").group(), "Foo::bar")
+
+    @patch("chardet.detect", return_value={"encoding": "UTF-16LE"})
+    def test_utf16_no_bom(self, mock_detect):
+        path = self._write("a.cpp", "int Foo::bar();\n".encode("utf-16-le"))
+        with MappedFile(path) as fh:
+            self.assertIn("Foo::bar(", fh)
+            self.assertEqual(fh.line_text(0), "int Foo::bar();")
+
+    def test_empty(self):
+        path = self._write("a.cpp", b"")
+        with MappedFile(path) as fh:
+            self.assertEqual(len(fh), 0)
+            self.assertEqual(fh.find("a"), -1)
+            self.assertEqual(fh.text(), "")
+
+    def test_file_processor_mmap(self):
+        paths = [self._write(name, b"SLL") for name in ("a.cpp", "b.hpp")]
+        found = [(fh.name, ftype, "SLL" in fh)
+                 for fh, ftype in FileProcessor(paths, "mmap")]
+        self.assertEqual(found, [(paths[0], ".cpp", True),
+                                 (paths[1], ".hpp", True)])
+        with self.assertRaises(FileNotFoundError):
+            next(iter(FileProcessor(os.path.join(self.root, "x.cpp"),
+                                    "mmap")))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,131 @@
+from core.ingest import Ingester, normalize
+from core.manifest import Manifest
+
+import unittest
+import os
+import io
+import tarfile
+import zipfile
+import tempfile
+
+
+# Local globals:
+_milestone = "milestone5"
+_config = {
+    "prof": "hugh",
+}
+
+
+class TestIngester(unittest.TestCase):
+    def setUp(self):
+        self._root = tempfile.TemporaryDirectory()
+        self.root = self._root.name
+        self.src = os.path.join(self.root, "submissions")
+        self.path = os.path.join(self.root, "repos")
+        self.fhs = os.path.join(self.root, "project_fhs")
+        os.makedirs(self.src)
+        deploy = os.path.join(self.fhs, "milestone5-hugh")
+        os.makedirs(deploy)
+        for name in ("CMakeLists.txt", "ignore-notes.txt"):
+            with open(os.path.join(deploy, name), "w") as file:
+                file.write(name)
+
+    def tearDown(self):
+        self._root.cleanup()
+
+    def _zip(self, name, files):
+        with zipfile.ZipFile(os.path.join(self.src, name), "w") as zip:
+            for member, data in files.items():
+                zip.writestr(member, data)
+
+    def _tar(self, name, files):
+        with tarfile.open(os.path.join(self.src, name), "w:gz") as tar:
+            for member, data in files.items():
+                info = tarfile.TarInfo(member)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data.encode()))
+
+    def _ingester(self, **kwargs):
+        return Ingester(_milestone, _config, path=self.path, fhs=self.fhs,
+                        **kwargs)
+
+    def _read(self, *path):
+        with open(os.path.join(self.path, *path)) as file:
+            return file.read()
+
+    def test_normalize(self):
+        self.assertEqual(normalize("John Smith\tLATE.zip"),
+                         "John-Smith-LATE.zip")
+
+    def test_ingest(self):
+        self._zip("John Smith.zip", {"src/Hash Table.cpp": "a",
+                                     "main.cpp": "b"})
+        self._tar("jane.tar.gz", {"main.cpp": "c"})
+        self._zip("noext", {"main.cpp": "d"})
+        with open(os.path.join(self.src, "solo.cpp"), "w") as file:
+            file.write("e")
+        with open(os.path.join(self.src, "notes.txt"), "w") as file:
+            file.write("f")
+
+        summary = self._ingester(workers=2).ingest(self.src)
+        self.assertEqual(summary["failed"], [])
+        self.assertEqual(summary["skipped"], ["notes.txt"])
+        self.assertEqual(self._read("John-Smith", "src", "Hash-Table.cpp"),
+                         "a")
+        self.assertEqual(self._read("jane", "main.cpp"), "c")
+        self.assertEqual(self._read("noext-noext", "main.cpp"), "d")
+        self.assertEqual(self._read("solo", "solo.cpp"), "e")
+        for name in ("John-Smith", "jane", "noext-noext", "solo"):
+            self.assertEqual(self._read(name, "CMakeLists.txt"),
+                             "CMakeLists.txt")
+            self.assertFalse(os.path.exists(
+                os.path.join(self.path, name, "ignore-notes.txt")
+            ))
+        # The source directory is left as is.
+        self.assertIn("John Smith.zip", os.listdir(self.src))
+
+        records = Manifest(self.path).load()
+        self.assertEqual(sorted(records),
+                         ["John-Smith", "jane", "noext-noext", "solo"])
+        self.assertTrue(all(len(r["head"]) == 40 for r in records.values()))
+        self.assertEqual(records["jane"]["status"], "ingested")
+
+    def test_reingest_unchanged(self):
+        self._zip("a.zip", {"main.cpp": "a"})
+        self._ingester().ingest(self.src)
+        self._zip("b.zip", {"main.cpp": "b"})
+        summary = self._ingester().ingest(self.src)
+        self.assertEqual({r["name"]: r["status"] for r in summary["results"]},
+                         {"a": "unchanged", "b": "ingested"})
+        self.assertEqual(sorted(Manifest(self.path).load()), ["a", "b"])
+
+    def test_late_filter(self):
+        self._zip("a_LATE.zip", {"main.cpp": "a"})
+        self._zip("b.zip", {"main.cpp": "b"})
+        summary = self._ingester(late="only").ingest(self.src)
+        self.assertEqual([r["name"] for r in summary["results"]], ["a_LATE"])
+        self.assertEqual(summary["skipped"], ["b.zip"])
+
+        summary = self._ingester(late="skip").ingest(self.src)
+        self.assertEqual([r["name"] for r in summary["results"]], ["b"])
+
+    def test_unsafe_members(self):
+        self._zip("a.zip", {"../escape.cpp": "x", "/abs.cpp": "y",
+                            "ok.cpp": "z"})
+        self._ingester().ingest(self.src)
+        self.assertFalse(os.path.exists(os.path.join(self.path,
+                                                     "escape.cpp")))
+        self.assertEqual(self._read("a", "abs.cpp"), "y")
+        self.assertEqual(self._read("a", "ok.cpp"), "z")
+
+    def test_bad_archive(self):
+        with open(os.path.join(self.src, "broken.zip"), "w") as file:
+            file.write("not a zip")
+        summary = self._ingester().ingest(self.src)
+        self.assertEqual(summary["failed"], ["broken"])
+        self.assertFalse(os.path.exists(os.path.join(self.path, "broken")))
+        self.assertIsNone(Manifest(self.path).load()["broken"]["head"])
+
+
+if __name__ == "__main__":
+    unittest.main()
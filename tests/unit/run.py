@@ -6,6 +6,12 @@ from tests.unit import shell_unit
 from tests.unit import build_unit
 from tests.unit import file_processor_unit
 from tests.unit import grader_unit
+from tests.unit import fetch_unit
+from tests.unit import scheduler_unit
+from tests.unit import webhook_unit
+from tests.unit import bundle_unit
+from tests.unit import ingest_unit
+from tests.unit import capabilities_unit
 
 import unittest
 from unittest.mock import patch, MagicMock
@@ -25,6 +31,12 @@ def main():
     suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(build_unit))
     suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(file_processor_unit))
     suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(grader_unit))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(fetch_unit))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(scheduler_unit))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(webhook_unit))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(bundle_unit))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(ingest_unit))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(capabilities_unit))
 
     # Run test suite.
     runner = unittest.TextTestRunner(verbosity=2)
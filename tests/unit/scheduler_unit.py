@@ -0,0 +1,137 @@
+from core.scheduler import RequestScheduler
+
+import unittest
+from unittest.mock import patch, MagicMock
+import time
+import requests
+from email.utils import formatdate
+
+
+def _response(status=200, text="", **headers):
+    """ Helper function to create a mock API response. """
+    response = MagicMock()
+    response.status_code = status
+    response.text = text
+    response.headers = headers
+    return response
+
+
+class TestRequestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.sleeps = []
+        self.scheduler = RequestScheduler(concurrency=8, retries=3,
+                                          sleep=self.sleeps.append)
+
+    def test_success(self):
+        response = _response(**{"X-RateLimit-Remaining": "4000"})
+        self.assertIs(self.scheduler.request(lambda: response), response)
+        self.assertEqual(self.sleeps, [])
+
+    def test_retry_server_error(self):
+        first = _response(502)
+        responses = iter([first, _response(503), _response(200)])
+        response = self.scheduler.request(lambda: next(responses))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.sleeps), 2)
+        # Retried responses are closed; the final one is the caller's.
+        first.close.assert_called_once()
+        response.close.assert_not_called()
+        # Jittered exponential backoff.
+        self.assertLess(self.sleeps[0], self.sleeps[1] * 1.5)
+
+    def test_retry_after(self):
+        responses = iter([_response(429, **{"Retry-After": "7"}),
+                          _response(200)])
+        self.scheduler.request(lambda: next(responses))
+        self.assertEqual(self.sleeps, [7.0])
+
+    def test_retry_after_date(self):
+        date = formatdate(time.time() + 30, usegmt=True)
+        responses = iter([_response(503, **{"Retry-After": date}),
+                          _response(200)])
+        self.scheduler.request(lambda: next(responses))
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertGreater(self.sleeps[0], 25)
+        self.assertLessEqual(self.sleeps[0], 30)
+
+    def test_secondary_limit(self):
+        message = ('{"message": "You have exceeded a secondary rate limit. '
+                   'Please wait a few minutes before you try again."}')
+        responses = iter([
+            _response(403, text=message, **{"X-RateLimit-Remaining": "100"}),
+            _response(200),
+        ])
+        response = self.scheduler.request(lambda: next(responses))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertGreaterEqual(self.sleeps[0], 60)
+
+    def test_exhausted_sleeps_until_reset(self):
+        reset = str(int(time.time()) + 60)
+        responses = iter([
+            _response(403, **{"X-RateLimit-Remaining": "0",
+                              "X-RateLimit-Reset": reset}),
+            _response(200),
+        ])
+        self.scheduler.request(lambda: next(responses))
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertGreater(self.sleeps[0], 55)
+
+    def test_forbidden_not_retried(self):
+        response = _response(403, text='{"message": "Bad credentials"}',
+                             **{"X-RateLimit-Remaining": "100"})
+        self.assertIs(self.scheduler.request(lambda: response), response)
+        self.assertEqual(self.sleeps, [])
+
+    def test_gives_up(self):
+        response = self.scheduler.request(lambda: _response(500))
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(self.sleeps), 3)
+
+    def test_connection_error(self):
+        def send():
+            raise requests.ConnectionError("refused")
+        with self.assertRaises(requests.ConnectionError):
+            self.scheduler.request(send)
+        self.assertEqual(len(self.sleeps), 3)
+
+    def test_adapts_concurrency(self):
+        self.scheduler._budget("core").limit = 4
+        self.scheduler.request(
+            lambda: _response(**{"X-RateLimit-Remaining": "20"})
+        )
+        self.assertEqual(self.scheduler.limit, 1)
+        for _ in range(10):
+            self.scheduler.request(
+                lambda: _response(**{"X-RateLimit-Remaining": "4000"})
+            )
+        self.assertEqual(self.scheduler.limit, 8)
+
+    def test_budget_per_resource(self):
+        reset = str(int(time.time()) + 60)
+        # A nearly spent search budget doesn't throttle core requests.
+        self.scheduler.request(
+            lambda: _response(**{"X-RateLimit-Resource": "search",
+                                 "X-RateLimit-Remaining": "0",
+                                 "X-RateLimit-Reset": reset}),
+            resource="search"
+        )
+        self.assertEqual(self.scheduler.limit_of("search"), 1)
+        self.assertEqual(self.scheduler.limit, 8)
+        self.scheduler.request(
+            lambda: _response(**{"X-RateLimit-Remaining": "4000"})
+        )
+        self.assertEqual(self.sleeps, [])
+
+        # But the next search request waits for the search reset.
+        self.scheduler.request(
+            lambda: _response(**{"X-RateLimit-Resource": "search",
+                                 "X-RateLimit-Remaining": "29"}),
+            resource="search"
+        )
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertGreater(self.sleeps[0], 55)
+
+
+if __name__ == "__main__":
+    unittest.main()
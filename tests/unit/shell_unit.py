@@ -1,4 +1,6 @@
-from core.shell import Shell
+from core.shell import Shell, TIMEOUT_CODE, set_async_limit
+from core.shell import family, set_trace, load_trace, summarize
+from core.capabilities import reset_capabilities
 from tools import util
 
 import unittest
@@ -6,9 +8,20 @@ from unittest.mock import patch, MagicMock
 import sys
 import subprocess
 import os
+import threading
+import asyncio
+import tempfile
+import time
 
 
 class TestShell(unittest.TestCase):
+    def setUp(self):
+        # Probe under each test's mocks, not a previous test's results.
+        reset_capabilities()
+
+    def tearDown(self):
+        reset_capabilities()
+
     @patch.object(os, 'name', 'nt')
     @patch('core.shell.Shell._get_git_bash_path',
         return_value = "C:\\Program Files\\Git\\bin\\bash.exe")
@@ -49,7 +62,8 @@ class TestShell(unittest.TestCase):
         mock_subprocess.return_value.stdout = "Command executed successfully"
 
         shell = Shell()
-        stdout, stderr, returncode = shell.cmd(["echo", "Hello, World!"])
+        with patch('tools.util.is_windows', return_value=True):
+            stdout, stderr, returncode = shell.cmd(["echo", "Hello, World!"])
         self.assertEqual(stdout, "Command executed successfully")
         self.assertEqual(returncode, 0)
 
@@ -63,6 +77,194 @@ class TestShell(unittest.TestCase):
         stdout, stderr, returncode = shell.cmd("echo \"Hello, World!\"")
         self.assertEqual(stdout, "Command executed successfully")
         self.assertEqual(returncode, 0)
+        # Without a timeout, the command stays in our session.
+        self.assertNotIn("start_new_session", mock_subprocess.call_args.kwargs)
+
+    def test_cmd_timeout(self):
+        shell = Shell("subprocess")
+        stdout, stderr, code = shell.cmd("sleep 5", timeout=0.2)
+        self.assertEqual(code, TIMEOUT_CODE)
+        self.assertIn("timed out", stderr)
+
+    @unittest.skipIf(util.is_windows(), "Process groups are POSIX only.")
+    def test_cmd_timeout_kills_group(self):
+        with tempfile.TemporaryDirectory() as root:
+            pidfile = os.path.join(root, "pid")
+            stdout, stderr, code = Shell("subprocess").cmd(
+                f"echo start; sleep 30 & echo $! > {pidfile}; wait",
+                timeout=0.3
+            )
+            self.assertEqual(code, TIMEOUT_CODE)
+            self.assertEqual(stdout, "start\n")
+            with open(pidfile) as file:
+                pid = int(file.read())
+        time.sleep(0.1)
+        self.assertTrue(_dead(pid))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            Shell("fish")
+
+
+@unittest.skipIf(util.is_windows(), "No persistent shell on Windows.")
+class TestPersistentShell(unittest.TestCase):
+    def setUp(self):
+        self.shell = Shell("persistent")
+
+    def test_framing(self):
+        self.assertEqual(self.shell.cmd("echo out; echo err >&2; exit 3"),
+                         ("out\n", "err\n", 3))
+        # Output that looks like a marker, or has no trailing newline.
+        self.assertEqual(self.shell.cmd("printf '__gc_x__ 0\\nmore'"),
+                         ("__gc_x__ 0\nmore", "", 0))
+
+    def test_isolation(self):
+        self.shell.cmd("cd /; FOO=bar; exit 1")
+        self.assertEqual(self.shell.cmd("pwd")[0].strip(), os.getcwd())
+        self.assertEqual(self.shell.cmd("echo x${FOO}x")[0], "xx\n")
+        stdout, stderr, code = self.shell.cmd("if then")
+        self.assertEqual(code, 2)
+        self.assertEqual(self.shell.cmd("echo ok")[0], "ok\n")
+
+    def test_env(self):
+        with patch.dict(os.environ, {"GC_SHELL_TEST": "a b'c"}):
+            self.assertEqual(self.shell.cmd("echo $GC_SHELL_TEST")[0],
+                             "a b'c\n")
+        self.assertEqual(self.shell.cmd("echo x${GC_SHELL_TEST}x")[0], "xx\n")
+
+    def test_timeout(self):
+        stdout, stderr, code = self.shell.cmd("echo start; sleep 5",
+                                              timeout=0.2)
+        self.assertEqual(code, TIMEOUT_CODE)
+        self.assertEqual(stdout, "start\n")
+        self.assertEqual(self.shell.cmd("echo back")[0], "back\n")
+
+    def test_restart(self):
+        stdout, stderr, code = self.shell.cmd("kill -9 $$")
+        self.assertEqual(code, -1)
+        self.assertEqual(self.shell.cmd("echo back"), ("back\n", "", 0))
+
+    def test_shared_per_thread(self):
+        pids = []
+        def pid():
+            pids.append(Shell("persistent").cmd("echo $$")[0])
+        pid()
+        pid()
+        thread = threading.Thread(target=pid)
+        thread.start()
+        thread.join()
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[0], pids[2])
+
+
+def _dead(pid):
+    """ Whether a process has exited (a zombie counts). """
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            return "zombie" in file.read()
+    except FileNotFoundError:
+        return True
+
+
+@unittest.skipIf(util.is_windows(), "Process groups are POSIX only.")
+class TestAsyncShell(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.shell = Shell()
+        self._root = tempfile.TemporaryDirectory()
+        self.pidfile = os.path.join(self._root.name, "pid")
+
+    def tearDown(self):
+        self._root.cleanup()
+        set_async_limit(os.cpu_count() or 4)
+
+    def _pid(self):
+        with open(self.pidfile) as file:
+            return int(file.read())
+
+    async def test_acmd(self):
+        self.assertEqual(await self.shell.acmd("echo out; echo err >&2; exit 3"),
+                         ("out\n", "err\n", 3))
+
+    async def test_limit(self):
+        set_async_limit(2)
+        start = time.monotonic()
+        await asyncio.gather(*[self.shell.acmd("sleep 0.2") for _ in range(4)])
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+
+    async def test_timeout_kills_group(self):
+        stdout, stderr, code = await self.shell.acmd(
+            f"echo start; sleep 30 & echo $! > {self.pidfile}; wait",
+            timeout=0.3
+        )
+        self.assertEqual(code, TIMEOUT_CODE)
+        self.assertEqual(stdout, "start\n")
+        await asyncio.sleep(0.1)
+        self.assertTrue(_dead(self._pid()))
+
+    async def test_cancel_kills_group(self):
+        task = asyncio.create_task(self.shell.acmd(
+            f"sleep 30 & echo $! > {self.pidfile}; wait"
+        ))
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.1)
+        self.assertTrue(_dead(self._pid()))
+
+
+class TestShellTrace(unittest.TestCase):
+    def setUp(self):
+        self._root = tempfile.TemporaryDirectory()
+        self.trace = os.path.join(self._root.name, "trace.jsonl")
+
+    def tearDown(self):
+        set_trace(None)
+        self._root.cleanup()
+
+    def test_family(self):
+        self.assertEqual(family(
+            "rm -rf b && mkdir -p b && cd b && cmake .. && make all && cd -"
+        ), "cmake")
+        self.assertEqual(family(
+            'cd p && echo $(git log -n 1 --pretty=format:"%h %an") && cd -'
+        ), "git")
+        self.assertEqual(family("GIT_SSH_COMMAND='ssh -o A=1' git clone x"),
+                         "git")
+        self.assertEqual(family("scripts/find-cpp.sh HashTable repo"),
+                         "find-cpp.sh")
+        self.assertEqual(family("echo hi"), "echo")
+
+    def test_trace(self):
+        set_trace(self.trace)
+        class Grader:
+            def run(self):
+                shell = Shell()
+                shell.cmd("echo hello")
+                shell.cmd("git --version >/dev/null; exit 2")
+        Grader().run()
+        set_trace(None)
+
+        records = load_trace(self.trace)
+        self.assertEqual([r["family"] for r in records], ["echo", "git"])
+        self.assertTrue(all(r["caller"] == "Grader" for r in records))
+        self.assertEqual(records[0]["stdout_bytes"], 6)
+        self.assertEqual(records[1]["code"], 2)
+        self.assertGreaterEqual(records[0]["wall"], 0)
+
+    def test_summarize(self):
+        records = [
+            {"family": "git", "wall": w, "cpu": 0.1, "code": 0}
+            for w in (0.1, 0.2, 0.3, 0.4, 2.0)
+        ] + [{"family": "cmake", "wall": 1.0, "cpu": None, "code": 1}]
+        rows = summarize(records)
+        self.assertEqual([r["key"] for r in rows], ["git", "cmake"])
+        self.assertEqual(rows[0]["count"], 5)
+        self.assertAlmostEqual(rows[0]["total"], 3.0)
+        self.assertEqual(rows[0]["p50"], 0.3)
+        self.assertEqual(rows[0]["p95"], 2.0)
+        self.assertIsNone(rows[1]["cpu"])
+        self.assertEqual(rows[1]["failed"], 1)
 
 
 if __name__ == "__main__":
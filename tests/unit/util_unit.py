@@ -5,6 +5,7 @@ from unittest.mock import patch, MagicMock
 import sys
 import subprocess
 import os
+import tempfile
 
 
 class TestUtil(unittest.TestCase):
@@ -54,6 +55,26 @@ class TestUtil(unittest.TestCase):
         s = util.lst_to_str(lst)
         self.assertEquals(s, "hi")
 
+    def test_repo_username(self):
+        self.assertEqual(
+            util.repo_username("milestone-5", "cachemanager-bst",
+                               "milestone-5-cachemanager-bst-user1"),
+            "user1"
+        )
+        self.assertIsNone(
+            util.repo_username("milestone-5", "cachemanager-bst", "other")
+        )
+
+    def test_write_atomic(self):
+        with tempfile.TemporaryDirectory() as root:
+            file = os.path.join(root, "cache", "a.json")
+            util.write_atomic(file, "old")
+            util.write_atomic(file, "new")
+            with open(file) as fh:
+                self.assertEqual(fh.read(), "new")
+            # No temporary files left behind.
+            self.assertEqual(os.listdir(os.path.dirname(file)), ["a.json"])
+
 
 if __name__ == "__main__":
     unittest.main()
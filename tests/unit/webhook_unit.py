@@ -0,0 +1,119 @@
+from core.webhook import PushListener, sign
+
+import unittest
+import json
+import threading
+import requests
+
+
+# Local globals:
+_secret = "s3cret"
+_name = "milestone-5-cachemanager-bst-user1"
+
+
+def _payload(name=_name, org="org", ref="refs/heads/main"):
+    return {
+        "ref": ref,
+        "deleted": False,
+        "repository": {
+            "name": name,
+            "full_name": f"{org}/{name}",
+            "default_branch": "main",
+            "owner": {"login": org},
+        },
+    }
+
+
+def _send(listener, payload, event="push", secret=_secret):
+    """ Stand-in for GitHub(R)'s webhook sender. """
+    body = json.dumps(payload).encode()
+    headers = {
+        "Content-Type": "application/json",
+        "X-GitHub-Event": event,
+        "X-GitHub-Delivery": "72d3162e-cc78-11e3-81ab-4c9367dc0958",
+    }
+    if secret is not None:
+        headers["X-Hub-Signature-256"] = sign(secret, body)
+    return requests.post(listener.url, data=body, headers=headers, timeout=5)
+
+
+class TestPushListener(unittest.TestCase):
+    def setUp(self):
+        self.handled = []
+        self.listener = PushListener(self.handled.append, _secret, org="org",
+                                     port=0, delay=0.1)
+        self.listener.start()
+
+    def tearDown(self):
+        self.listener.stop()
+
+    def test_push(self):
+        response = _send(self.listener, _payload())
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(self.listener.wait(5))
+        self.assertEqual(self.handled, [_name])
+
+    def test_bad_signature(self):
+        self.assertEqual(
+            _send(self.listener, _payload(), secret="wrong").status_code, 401
+        )
+        self.assertEqual(
+            _send(self.listener, _payload(), secret=None).status_code, 401
+        )
+        self.assertTrue(self.listener.wait(5))
+        self.assertEqual(self.handled, [])
+
+    def test_ping(self):
+        self.assertEqual(_send(self.listener, {}, event="ping").status_code,
+                         200)
+
+    def test_ignored(self):
+        _send(self.listener, _payload(org="other"))
+        _send(self.listener, _payload(ref="refs/heads/feature"))
+        _send(self.listener, _payload(), event="issues")
+        self.assertTrue(self.listener.wait(5))
+        self.assertEqual(self.handled, [])
+
+    def test_coalesce_burst(self):
+        for _ in range(5):
+            _send(self.listener, _payload())
+        _send(self.listener, _payload(name="other-repo"))
+        self.assertTrue(self.listener.wait(5))
+        self.assertEqual(sorted(self.handled), sorted([_name, "other-repo"]))
+
+    def test_push_while_handling(self):
+        started = threading.Event()
+        release = threading.Event()
+        def handle(name):
+            self.handled.append(name)
+            started.set()
+            release.wait(5)
+        self.listener._handle = handle
+
+        _send(self.listener, _payload())
+        self.assertTrue(started.wait(5))
+        # Pushes during a regrade queue exactly one more.
+        _send(self.listener, _payload())
+        _send(self.listener, _payload())
+        release.set()
+        self.assertTrue(self.listener.wait(5))
+        self.assertEqual(self.handled, [_name, _name])
+
+    def test_handler_error(self):
+        def handle(name):
+            self.handled.append(name)
+            raise RuntimeError("boom")
+        self.listener._handle = handle
+        _send(self.listener, _payload())
+        self.assertTrue(self.listener.wait(5))
+        _send(self.listener, _payload(name="next"))
+        self.assertTrue(self.listener.wait(5))
+        self.assertEqual(self.handled, [_name, "next"])
+
+    def test_requires_secret(self):
+        with self.assertRaises(ValueError):
+            PushListener(self.handled.append, "", port=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+"""
+Summarize a shell command trace (see `SHELL_TRACE`):
+
+    SHELL_TRACE=.cache/trace.jsonl python main.py milestone5-hugh -r
+    python -m tools.trace .cache/trace.jsonl
+    python -m tools.trace .cache/trace.jsonl --by caller
+"""
+
+from core.shell import load_trace, summarize
+
+import argparse
+
+
+def _fmt(seconds):
+    return "-" if seconds is None else f"{seconds:.3f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="trace")
+    parser.add_argument("trace", help="JSON Lines trace file.")
+    parser.add_argument("--by", choices=["family", "caller", "cmd"],
+                        default="family",
+                        help="Field to group commands by.")
+    parser.add_argument("-n", "--top", type=int, default=20,
+                        help="Groups to show.")
+    args = parser.parse_args()
+
+    records = load_trace(args.trace)
+    rows = summarize(records, by=args.by)
+    total = sum(row['total'] for row in rows) or 1.0
+
+    print(f"{args.by:<24} {'count':>6} {'total (s)':>10} {'%':>5} "
+          f"{'p50 (s)':>8} {'p95 (s)':>8} {'cpu (s)':>8} {'failed':>6}")
+    for row in rows[:args.top]:
+        key = str(row['key'])
+        if len(key) > 24:
+            key = key[:21] + "..."
+        print(f"{key:<24} {row['count']:>6} {row['total']:>10.3f} "
+              f"{100 * row['total'] / total:>5.1f} {_fmt(row['p50']):>8} "
+              f"{_fmt(row['p95']):>8} {_fmt(row['cpu']):>8} "
+              f"{row['failed']:>6}")
+    print(f"{len(records)} commands, {sum(r['total'] for r in rows):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
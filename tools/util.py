@@ -1,5 +1,6 @@
 import os
 import re
+import threading
 
 
 def is_windows():
@@ -23,6 +24,19 @@ def check_file(file):
     return True
 
 
+# Writes `text` to `file` by writing a temporary file next to it then renaming
+# it over `file`, so a concurrent reader (another thread, or another run) never
+# sees a partial file.
+def write_atomic(file, text):
+    dir = os.path.dirname(file)
+    if dir:
+        os.makedirs(dir, exist_ok=True)
+    tmp = f"{file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as fh:
+        fh.write(text)
+    os.replace(tmp, file)
+
+
 # Splits a PascalCase class name into a list: `["Pascal", "Case"]`.
 def split_clazz_name(clazz):
     """ Split class name into words based on uppercase letters. """
@@ -55,6 +69,15 @@ def fmtout(s: str, width: int = 80, border: str = "#") -> str:
 def fmt_milestone(s):
     return re.sub(r"(\D)(\d+)", r"\1-\2", s) 
 
+# Given a formatted milestone, the config glob and a repo name, return the
+# GitHub(R) username the repo belongs to, or None.
+def repo_username(fmilestone, glob, repo):
+    # xxx could prolly anchor `^`, but we know this pattern works.
+    reg = re.search(f"{fmilestone}-{glob}-(.*)$", repo)
+    if reg != None and reg[1] != None:
+        return reg[1]
+    return None
+
 # Returns dictionary of classes, with class as key and string list of methods
 # as value.
 def methods_to_strlst(config):